@@ -0,0 +1,106 @@
+"""
+Compare the lowering of task commands to CWL arguments by CommandTemplate (one pass over the parts of the command)
+with the previous implementation (string concatenation, then a regex split of the whole command and per-chunk
+re.sub), over the commands of the GATK wrappers in examples/
+
+    python benchmarks/bench_command.py [--repeat N]
+
+wdl2cwl must be importable (installed, or the repository root on PYTHONPATH)
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import timeit
+
+import wdl_parser
+
+from wdl2cwl.main import bind_separated_inputs, clean_command, convert, find_asts, handleRawCommand, ihandle
+
+GATK_WRAPPERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'gatk_wrappers',
+                             'WDLTasks_3.6')
+
+
+def previous_raw_command(item, context=None, **kwargs):
+    """
+    handleRawCommand before CommandTemplate
+    """
+    s = body = ''
+    symbols = []
+    segments = []
+    parts = item.attr('parts')
+    for p in parts:
+        kwargs['command'] = s
+        part = ihandle(p, **kwargs)
+        if type(part) is list:
+            body += part[0]
+            s += part[1]
+            symbols.append(part[1])
+            segments.append((part[2], part[3]))
+        else:
+            s += part
+            segments.append(part)
+    if body:
+        arguments = bind_separated_inputs(segments, context)
+        if arguments is not None:
+            context["arguments"] = arguments
+            return
+    if body:
+        symbols.append(r'\$\(.*?\)')
+        chunks = re.split('(' + '|'.join(symbols) + ')', s)
+        res = []
+        for k in chunks:
+            if k in set(symbols[:-1]):
+                res.append(k)
+            elif '$' in k:
+                res.append(re.sub('[$()]', '', k))
+            else:
+                res.append("\"" + k + "\"")
+        s = ' + '.join(res)
+        result = '${' + body + 'return ' + s + '}'
+    else:
+        result = s
+    context["arguments"] = [{"valueFrom": clean_command(result), "shellQuote": False}]
+
+
+def load_commands(parser):
+    """
+    Return (RawCommand, tool, File inputs) of every task of the GATK wrappers
+    """
+    commands = []
+    for name in sorted(os.listdir(GATK_WRAPPERS)):
+        if not name.endswith('.wdl'):
+            continue
+        with open(os.path.join(GATK_WRAPPERS, name)) as f:
+            ast = parser.parse(f.read()).ast()
+        documents = convert(ast)
+        for task in find_asts(ast, 'Task'):
+            tool = documents[task.attr('name').source_string + '.cwl']
+            filevars = set(inp['id'] for inp in tool['inputs'] if 'File' in str(inp['type']))
+            for command in find_asts(task, 'RawCommand'):
+                commands.append((command, {'inputs': tool['inputs']}, filevars))
+    return commands
+
+
+def lower(function, commands):
+    for command, tool, filevars in commands:
+        function(command, context=dict(tool), filevars=filevars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the lowering of task commands')
+    parser.add_argument('--repeat', type=int, default=50, help='Number of lowerings per command')
+    args = parser.parse_args()
+
+    commands = load_commands(wdl_parser.parsers['draft-2'])
+    before = min(timeit.repeat(lambda: lower(previous_raw_command, commands), number=args.repeat, repeat=5))
+    after = min(timeit.repeat(lambda: lower(handleRawCommand, commands), number=args.repeat, repeat=5))
+    print('{0} commands, {1} repeats, best of 5'.format(len(commands), args.repeat))
+    print('previous        : {0:.4f} s'.format(before))
+    print('CommandTemplate : {0:.4f} s'.format(after))
+    print('speedup         : {0:.2f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Time every stage of the conversion pipeline (parse, AST walk, handler dispatch, export) for the WDL files in examples/
+and the snippets in tests/primitive_workflows_wld.py, and report the results as JSON so that they can be compared
+between releases:
+
+    python benchmarks/bench_pipeline.py [--repeat N] [--output results.json]
+
+Each stage is timed separately and the best of N runs is reported. Files that fail to convert are reported with the
+error and the stages they got through.
+
+wdl2cwl must be importable (installed, or the repository root on PYTHONPATH)
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import runpy
+import shutil
+import sys
+import tempfile
+import timeit
+
+import wdl_parser
+
+import wdl2cwl.main as converter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXAMPLES = os.path.join(ROOT, 'examples')
+SNIPPETS = os.path.join(ROOT, 'tests', 'primitive_workflows_wld.py')
+STAGES = ['parse', 'walk', 'dispatch', 'export']
+
+
+def load_corpus():
+    """
+    Return (name, WDL source) pairs of the benchmark corpus
+    """
+    corpus = []
+    for root, dirs, files in os.walk(EXAMPLES):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.wdl'):
+                path = os.path.join(root, name)
+                with open(path) as f:
+                    corpus.append((os.path.relpath(path, ROOT), f.read()))
+    snippets = runpy.run_path(SNIPPETS)
+    for name in sorted(snippets):
+        if name.startswith('wdl_code'):
+            corpus.append(('{0}:{1}'.format(os.path.relpath(SNIPPETS, ROOT), name), snippets[name]))
+    return corpus
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def bench_file(code, parser, directory, repeat):
+    result = dict((stage, None) for stage in STAGES)
+    result['lines'] = code.count('\n') + 1
+    try:
+        ast = parser.parse(code).ast()
+        result['parse'] = best_of(lambda: parser.parse(code).ast(), repeat)
+        index = converter.AstIndex(ast)
+        result['walk'] = best_of(lambda: converter.AstIndex(ast), repeat)
+        documents = list(converter.iter_documents(index))
+        result['dispatch'] = best_of(lambda: list(converter.iter_documents(index)), repeat)
+
+        def export():
+            # a fresh directory every time: write_file skips files that already hold the same content
+            target = tempfile.mkdtemp(dir=directory)
+            start = timeit.default_timer()
+            for filename, document in documents:
+                converter.export_tool(document, target, quiet=True, filename=filename)
+            return timeit.default_timer() - start
+        export()
+        result['export'] = min(export() for _ in range(repeat))
+    except Exception as e:
+        result['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+    return result
+
+
+def summarize(files):
+    totals = dict((stage, sum(f[stage] for f in files if f[stage] is not None)) for stage in STAGES)
+    totals['total'] = sum(totals.values())
+    totals['files'] = len(files)
+    totals['failed'] = len([f for f in files if 'error' in f])
+    totals['lines'] = sum(f['lines'] for f in files)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the conversion pipeline over the bundled examples')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per stage (the best one is reported)')
+    parser.add_argument('--parser', default='draft-2', choices=wdl_parser.parsers.keys())
+    parser.add_argument('-o', '--output', help='File to write the JSON results to (default: stdout)')
+    args = parser.parse_args()
+
+    converter.logger.setLevel(logging.ERROR)
+    directory = tempfile.mkdtemp()
+    try:
+        files = []
+        for name, code in load_corpus():
+            result = bench_file(code, wdl_parser.parsers[args.parser], directory, args.repeat)
+            result['name'] = name
+            files.append(result)
+    finally:
+        shutil.rmtree(directory)
+
+    results = {'wdl2cwl': converter.__version__,
+               'python': platform.python_version(),
+               'parser': args.parser,
+               'repeat': args.repeat,
+               'totals': summarize(files),
+               'files': files}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    totals = results['totals']
+    print('{files} files ({failed} failed), {lines} lines of WDL'.format(**totals), file=sys.stderr)
+    for stage in STAGES + ['total']:
+        print('{0:<9} {1:.4f} s'.format(stage, totals[stage]), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Measure how conversion time and peak memory grow with the size of synthetic workflows (see synthetic.py):
+
+    python benchmarks/bench_scaling.py [--scales 1,2,4,8,16] [--tasks 10 --calls 50 --scatters 5 --fan-in 10]
+
+Every count is multiplied by each scale. For every pair of consecutive scales the growth exponent
+log(t2 / t1) / log(s2 / s1) is reported: about 1 for linear behaviour, about 2 for quadratic. Exponents above
+--threshold are flagged. Results are printed as a table and, with --output, written as JSON.
+
+wdl2cwl must be importable (installed, or the repository root on PYTHONPATH)
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import math
+import sys
+import timeit
+import tracemalloc
+
+import wdl_parser
+
+import wdl2cwl.main as converter
+from synthetic import generate_workflow
+
+
+def measure(wdl, parser, repeat):
+    ast = parser.parse(wdl).ast()
+    result = {'lines': wdl.count('\n'),
+              'parse': min(timeit.repeat(lambda: parser.parse(wdl).ast(), number=1, repeat=repeat)),
+              'convert': min(timeit.repeat(lambda: converter.convert(ast), number=1, repeat=repeat))}
+    tracemalloc.start()
+    converter.convert(ast)
+    result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def growth(results, key):
+    exponents = [None]
+    for previous, current in zip(results, results[1:]):
+        if previous[key] > 0 and current[key] > 0:
+            exponents.append(math.log(current[key] / previous[key]) / math.log(current['scale'] / previous['scale']))
+        else:
+            exponents.append(None)
+    return exponents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark conversion of growing synthetic workflows')
+    parser.add_argument('--scales', default='1,2,4,8,16', help='Comma separated multipliers of the counts below')
+    parser.add_argument('--tasks', type=int, default=10, help='Number of tasks at scale 1')
+    parser.add_argument('--calls', type=int, default=50, help='Number of top-level calls at scale 1')
+    parser.add_argument('--scatters', type=int, default=5, help='Number of scatter blocks at scale 1')
+    parser.add_argument('--fan-in', type=int, default=10, help='Number of outputs merged by one call at scale 1')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per measurement (the best one is used)')
+    parser.add_argument('--threshold', type=float, default=1.3, help='Growth exponent flagged as super-linear')
+    parser.add_argument('-o', '--output', help='File to write the JSON results to')
+    args = parser.parse_args()
+
+    converter.logger.setLevel(logging.ERROR)
+    wdl_parser_module = wdl_parser.parsers['draft-2']
+    results = []
+    for scale in [int(s) for s in args.scales.split(',')]:
+        wdl = generate_workflow(args.tasks * scale, args.calls * scale, args.scatters * scale, args.fan_in * scale)
+        result = measure(wdl, wdl_parser_module, args.repeat)
+        result.update({'scale': scale,
+                       'tasks': args.tasks * scale,
+                       'calls': args.calls * scale,
+                       'scatters': args.scatters * scale,
+                       'fan_in': args.fan_in * scale})
+        results.append(result)
+        print('scale {0} done'.format(scale), file=sys.stderr)
+
+    for key in ['parse', 'convert', 'peak_memory']:
+        for result, exponent in zip(results, growth(results, key)):
+            result[key + '_exponent'] = exponent
+
+    print('{0:>6} {1:>7} {2:>10} {3:>6} {4:>10} {5:>6} {6:>12} {7:>6}'.format(
+        'scale', 'lines', 'parse (s)', 'exp', 'convert(s)', 'exp', 'peak (KiB)', 'exp'))
+    flagged = []
+    for result in results:
+        row = [result['scale'], result['lines']]
+        for key in ['parse', 'convert', 'peak_memory']:
+            exponent = result[key + '_exponent']
+            row.append(result[key] / 1024.0 if key == 'peak_memory' else result[key])
+            row.append('-' if exponent is None else '{0:.2f}{1}'.format(exponent, '!' if exponent > args.threshold
+                                                                       else ''))
+            if exponent is not None and exponent > args.threshold:
+                flagged.append((key, result['scale'], exponent))
+        print('{0:>6} {1:>7} {2:>10.4f} {3:>6} {4:>10.4f} {5:>6} {6:>12.1f} {7:>6}'.format(*row))
+    for key, scale, exponent in flagged:
+        print('super-linear {0} at scale {1}: exponent {2:.2f}'.format(key, scale, exponent))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'wdl2cwl': converter.__version__, 'threshold': args.threshold, 'results': results}, f,
+                      indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
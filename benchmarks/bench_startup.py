@@ -0,0 +1,80 @@
+"""
+Measure the cold-start latency of the command line: importing wdl2cwl.main, `wdl2cwl --help` and the conversion of a
+single file, each in a fresh interpreter (the start of a bare interpreter is measured too, for reference)
+
+    python benchmarks/bench_startup.py [--repeat N] [--file <workflow.wdl>] [--imports]
+
+--imports also lists the modules whose import takes longest (python -X importtime). wdl2cwl must be importable
+(installed, or the repository root on PYTHONPATH)
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+DEFAULT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'gatk_wrappers',
+                            'WDLTasks_3.6', 'ASEReadCounter_3.6.wdl')
+
+
+def run(command, repeat):
+    """
+    Return the times of `repeat` runs of a command, in milliseconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        subprocess.check_call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((timeit.default_timer() - start) * 1000)
+    return sorted(times)
+
+
+def slowest_imports(limit=15):
+    """
+    Return the modules imported by wdl2cwl.main with the highest cumulative import time, as (microseconds, name)
+    """
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import wdl2cwl.main'],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    imports = []
+    for line in output.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            own, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cold start of wdl2cwl')
+    parser.add_argument('--repeat', type=int, default=10, help='Number of runs of every command')
+    parser.add_argument('--file', default=DEFAULT_FILE, help='WDL file to convert')
+    parser.add_argument('--parser', default='draft-2', help='WDL version of the file')
+    parser.add_argument('--imports', action='store_true', help='List the slowest imports of wdl2cwl.main')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        cases = [('python', [sys.executable, '-c', 'pass']),
+                 ('import wdl2cwl.main', [sys.executable, '-c', 'import wdl2cwl.main']),
+                 ('wdl2cwl --help', [sys.executable, '-m', 'wdl2cwl.main', '--help']),
+                 ('wdl2cwl <file>', [sys.executable, '-m', 'wdl2cwl.main', os.path.abspath(args.file),
+                                     '--parser', args.parser, '-q', '-d', tmp])]
+        print('{0:<24} {1:>10} {2:>10}   ({3} runs)'.format('', 'median ms', 'min ms', args.repeat))
+        for name, command in cases:
+            times = run(command, args.repeat)
+            print('{0:<24} {1:>10.1f} {2:>10.1f}'.format(name, times[len(times) // 2], times[0]))
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.imports:
+        print()
+        for cumulative, name in slowest_imports():
+            print('{0:>10.1f} ms {1}'.format(cumulative / 1000.0, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare the time spent walking WDL ASTs with repeated find_asts calls (one recursive walk per node type, as
+printstuff used to do) and with a single AstIndex walk, over the WDL files in examples/
+
+    python benchmarks/bench_walk.py [--repeat N]
+
+wdl2cwl must be importable (installed, or the repository root on PYTHONPATH)
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import timeit
+
+import wdl_parser
+
+from wdl2cwl.main import AstIndex, find_asts
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples')
+
+
+def find_wdl_files(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith('.wdl'):
+                yield os.path.join(root, name)
+
+
+def walk_find_asts(ast):
+    return find_asts(ast, 'Task'), find_asts(ast, 'Workflow')
+
+
+def walk_index(ast):
+    index = AstIndex(ast)
+    return index.find('Task'), index.find('Workflow')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AST walking over the examples corpus')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of walks per file')
+    parser.add_argument('--parser', default='draft-2', choices=wdl_parser.parsers.keys())
+    args = parser.parse_args()
+
+    asts = []
+    for path in find_wdl_files(EXAMPLES):
+        with open(path) as f:
+            asts.append(wdl_parser.parsers[args.parser].parse(f.read()).ast())
+
+    before = timeit.timeit(lambda: [walk_find_asts(ast) for ast in asts], number=args.repeat)
+    after = timeit.timeit(lambda: [walk_index(ast) for ast in asts], number=args.repeat)
+    print('{0} files, {1} repeats'.format(len(asts), args.repeat))
+    print('find_asts x2 : {0:.4f} s'.format(before))
+    print('AstIndex     : {0:.4f} s'.format(after))
+    print('speedup      : {0:.2f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
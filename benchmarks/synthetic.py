@@ -0,0 +1,85 @@
+"""
+Generator of synthetic WDL workflows for scaling tests:
+
+    python benchmarks/synthetic.py --tasks N --calls M --scatters K --fan-in I [-o workflow.wdl]
+
+The workflow has N tasks and M top-level calls. Call i reads the output of call (i - 1) // 2, so outputs fan out
+to a binary tree of consumers. Each of the K scatter blocks runs a chain of calls over the samples, and a final
+merge call collects the outputs of the last I top-level calls (fan-in).
+"""
+from __future__ import print_function
+
+import argparse
+
+TASK = """task task_{i} {{
+  File in_file
+  Int n
+  String? label
+  command {{
+    tool_{i} --n ${{n}} ${{in_file}} > out_{i}_${{n}}.txt
+  }}
+  output {{
+    File out = "out_{i}_${{n}}.txt"
+    File log = stdout()
+  }}
+}}
+"""
+
+MERGE = """task merge {
+  Array[File] in_files
+  String name
+  command {
+    cat ${sep=" " in_files} > ${name}.txt
+  }
+  output {
+    File merged = "${name}.txt"
+  }
+}
+"""
+
+
+def generate_workflow(tasks=10, calls=50, scatters=5, fan_in=10, scatter_depth=3):
+    """
+    Return the source of a synthetic WDL (draft-2) workflow
+    """
+    lines = [TASK.format(i=i) for i in range(tasks)]
+    lines.append(MERGE)
+    lines.append('workflow synthetic {')
+    lines.append('  File input_file')
+    lines.append('  Array[File] samples')
+    for i in range(calls):
+        source = 'call_{0}.out'.format((i - 1) // 2) if i else 'input_file'
+        lines.append('  call task_{0} as call_{1} {{input: in_file={2}, n={1}}}'.format(i % tasks, i, source))
+    for k in range(scatters):
+        lines.append('  scatter (sample_{0} in samples) {{'.format(k))
+        for j in range(scatter_depth):
+            source = 'scatter_{0}_{1}.out'.format(k, j - 1) if j else 'sample_{0}'.format(k)
+            lines.append('    call task_{0} as scatter_{1}_{2} {{input: in_file={3}, n={2}}}'.format(
+                (k + j) % tasks, k, j, source))
+        lines.append('  }')
+    if fan_in and calls:
+        sources = ['call_{0}.out'.format(i) for i in range(max(calls - fan_in, 0), calls)]
+        lines.append('  call merge {{input: in_files=[{0}], name="merged"}}'.format(', '.join(sources)))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic WDL workflow')
+    parser.add_argument('--tasks', type=int, default=10, help='Number of tasks')
+    parser.add_argument('--calls', type=int, default=50, help='Number of top-level calls')
+    parser.add_argument('--scatters', type=int, default=5, help='Number of scatter blocks')
+    parser.add_argument('--scatter-depth', type=int, default=3, help='Number of chained calls in each scatter block')
+    parser.add_argument('--fan-in', type=int, default=10, help='Number of call outputs collected by the merge call')
+    parser.add_argument('-o', '--output', help='File to write the workflow to (default: stdout)')
+    args = parser.parse_args()
+    wdl = generate_workflow(args.tasks, args.calls, args.scatters, args.fan_in, args.scatter_depth)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(wdl)
+    else:
+        print(wdl, end='')
+
+
+if __name__ == '__main__':
+    main()
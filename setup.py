@@ -9,15 +9,16 @@ setup(name="wdl2cwl",
       url='https://github.com/common-workflow-language/wdl2cwl',
       install_requires=[
           'future',
-          'jinja2',
           'wdl-parser'
       ],
       packages=find_packages(),
-      package_data={'wdl2cwl': ['templates/*', 'expression-tools/*']},
+      package_data={'wdl2cwl': ['expression-tools/*']},
       include_package_data=True,
       entry_points={
           'console_scripts': [
-              'wdl2cwl=wdl2cwl.main:main'
+              'wdl2cwl=wdl2cwl.main:main',
+              'wdl2cwl-server=wdl2cwl.server:server_main',
+              'wdl2cwl-client=wdl2cwl.server:client_main'
           ]
       },
       classifiers=[
@@ -0,0 +1,86 @@
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+import zlib
+from unittest import mock
+
+import wdl_parser
+
+from wdl2cwl.cache import AstCache
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+
+def read_test_file(name):
+    with open(os.path.join(TEST_DATA, name)) as f:
+        return f.read()
+
+
+class AstCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.parser = wdl_parser.parsers['draft-2']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cached_ast_matches_parsed_ast(self):
+        code = read_test_file('scatter.wdl')
+        cache = AstCache(self.tmp)
+        first = cache.parse(code, self.parser)
+        second = AstCache(self.tmp).parse(code, self.parser)
+        self.assertEqual(first.dumps(indent=2), second.dumps(indent=2))
+        self.assertEqual(second.__class__, self.parser.Ast)
+
+    def test_hits_and_misses(self):
+        cache = AstCache(self.tmp)
+        code = read_test_file('task.wdl')
+        cache.parse(code, self.parser)
+        cache.parse(code, self.parser)
+        cache.parse(code + '\n', self.parser)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_undecodable_entries_are_misses(self):
+        cache = AstCache(self.tmp)
+        code = read_test_file('task.wdl')
+        key = cache.key(code, self.parser)
+        for data in [pickle.dumps(('T', 'id')), zlib.compress(pickle.dumps(('T', 'id'))), zlib.compress(b'["X"]')]:
+            with open(cache.path(key), 'wb') as f:
+                f.write(data)
+            self.assertIsNone(cache.get(key, self.parser))
+            self.assertFalse(os.path.exists(cache.path(key)))
+
+    def test_key_depends_on_parser(self):
+        cache = AstCache(self.tmp)
+        code = read_test_file('task.wdl')
+        self.assertNotEqual(cache.key(code, self.parser), cache.key(code, wdl_parser.parsers['draft-3']))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = AstCache(self.tmp)
+        codes = [read_test_file(name) for name in ['task.wdl', 'scatter.wdl', 'ctask.wdl']]
+        for i, code in enumerate(codes):
+            cache.parse(code, self.parser)
+            os.utime(cache.path(cache.key(code, self.parser)), (time.time() - 100 + i, time.time() - 100 + i))
+        cache.parse(codes[0], self.parser)  # task.wdl becomes the most recently used entry
+        sizes = dict((code, os.path.getsize(cache.path(cache.key(code, self.parser)))) for code in codes)
+        cache.max_size = sizes[codes[0]] + sizes[codes[2]]
+        cache.evict()
+        cached = [code for code in codes if os.path.exists(cache.path(cache.key(code, self.parser)))]
+        self.assertEqual(cached, [codes[0], codes[2]])
+
+    def test_directory_is_only_listed_when_full(self):
+        cache = AstCache(self.tmp)
+        codes = [read_test_file(name) for name in ['task.wdl', 'scatter.wdl', 'ctask.wdl']]
+        with mock.patch('wdl2cwl.cache.os.listdir', wraps=os.listdir) as listdir:
+            for code in codes:
+                cache.parse(code, self.parser)
+            self.assertEqual(listdir.call_count, 1)
+            cache.max_size = cache.size - 1
+            cache.parse(codes[0] + '\n', self.parser)
+            self.assertEqual(listdir.call_count, 2)
+        self.assertLessEqual(cache.size, cache.max_size)
+        self.assertEqual(cache.size, sum(os.path.getsize(os.path.join(self.tmp, name)) for name in os.listdir(self.tmp)))
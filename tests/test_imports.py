@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import wdl_parser
+
+from wdl2cwl import main
+from wdl2cwl.imports import ImportGraph
+
+from test_main import make_args
+
+LIB_WDL = """
+task inc {
+  Int i
+  command <<<
+  python -c "print(${i} + 1)"
+  >>>
+  output {
+    Int incremented = read_int(stdout())
+  }
+}
+"""
+
+WF_WDL = """
+import "lib.wdl" as lib
+
+workflow wf {
+  call lib.inc {input: i=1}
+  output {
+    inc.*
+  }
+}
+"""
+
+WF2_WDL = """
+import "lib.wdl"
+
+workflow wf2 {
+  call lib.inc as first {input: i=1}
+  call lib.inc as second {input: i=first.incremented}
+}
+"""
+
+
+class ImportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.target = tempfile.mkdtemp()
+        # the importing files come first, the batch has to reorder them
+        for name, code in [('wf.wdl', WF_WDL), ('wf2.wdl', WF2_WDL), ('lib.wdl', LIB_WDL)]:
+            self.write(name, code)
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.target)
+
+    def write(self, name, code):
+        with open(os.path.join(self.source, name), 'w') as f:
+            f.write(code)
+
+    def path(self, name):
+        return os.path.join(self.source, name)
+
+    def graph(self):
+        parser = wdl_parser.parsers['draft-2']
+
+        def parse(code, file_parser):
+            self.parsed.append(code)
+            return file_parser.parse(code).ast()
+        return ImportGraph(parse, parser)
+
+    def read_cwl(self, *path):
+        with open(os.path.join(self.target, *path)) as f:
+            header, comment, code = f.read().split('\n', 2)
+        return json.loads(code)
+
+    def test_order(self):
+        graph = self.graph()
+        files = [self.path('wf.wdl'), self.path('wf2.wdl'), self.path('lib.wdl')]
+        self.assertEqual(graph.order(files), [self.path('lib.wdl'), self.path('wf.wdl'), self.path('wf2.wdl')])
+        self.assertEqual(graph.dependencies(self.path('wf2.wdl')), [self.path('lib.wdl')])
+
+    def test_import_cycle_is_broken(self):
+        self.write('lib.wdl', 'import "wf.wdl"\n' + LIB_WDL)
+        graph = self.graph()
+        self.assertEqual(graph.order([self.path('wf.wdl'), self.path('lib.wdl')]),
+                         [self.path('lib.wdl'), self.path('wf.wdl')])
+
+    def test_convert(self):
+        documents = main.convert(WF_WDL.replace('lib.wdl', self.path('lib.wdl')), wdl_parser.parsers['draft-2'])
+        self.assertEqual(list(documents), ['lib.inc.cwl', 'wf.cwl'])
+        self.assertEqual(documents['lib.inc.cwl']['id'], 'inc')
+        step = documents['wf.cwl']['steps'][0]
+        self.assertEqual((step['id'], step['run']), ('inc', 'lib.inc.cwl'))
+        self.assertEqual(documents['wf.cwl']['outputs'][0]['type'], 'int')
+
+    def test_packed_imported_task_named_like_a_local_task(self):
+        wdl = WF_WDL.replace('lib.wdl', self.path('lib.wdl')).replace('workflow wf {', LIB_WDL + """
+workflow wf {
+  call inc as local {input: i=2}""")
+        packed = main.pack(main.convert(wdl, wdl_parser.parsers['draft-2']).items())
+        self.assertEqual([document['id'] for document in packed['$graph']], ['#inc', '#lib.inc', '#wf'])
+        steps = packed['$graph'][-1]['steps']
+        self.assertEqual([(step['id'], step['run']) for step in steps], [('local', '#inc'), ('inc', '#lib.inc')])
+
+    def test_imported_file_is_parsed_once(self):
+        graph = self.graph()
+        args = make_args(self.source, self.target)
+        for file in graph.order([self.path('wf.wdl'), self.path('wf2.wdl'), self.path('lib.wdl')]):
+            main.process_file(file, args, imports=graph)
+        self.assertEqual(len(self.parsed), 3)
+        self.assertEqual(list(graph.tools), [self.path('lib.wdl')])
+        # the AST of the imported file is not kept once its tools are converted
+        self.assertEqual(graph.asts, {})
+        self.assertEqual(self.read_cwl('wf2', 'lib.inc.cwl'), self.read_cwl('lib', 'inc.cwl'))
+        steps = self.read_cwl('wf2', 'wf2.cwl')['steps']
+        self.assertEqual([step['run'] for step in steps], ['lib.inc.cwl', 'lib.inc.cwl'])
+
+    def test_tasks_of_the_batch_are_converted_once(self):
+        converted = []
+
+        def handle_task(item, **kwargs):
+            converted.append(item.attr('name').source_string)
+            return main.handleTask(item, **kwargs)
+        graph = self.graph()
+        args = make_args(self.source, self.target)
+        with mock.patch.dict(main.handlers, Task=handle_task):
+            for file in graph.order([self.path('wf.wdl'), self.path('wf2.wdl'), self.path('lib.wdl')]):
+                main.process_file(file, args, imports=graph)
+        self.assertEqual(converted, ['inc'])
+        self.assertEqual(list(graph.tools[self.path('lib.wdl')]), ['inc'])
+        self.assertEqual(self.read_cwl('wf', 'lib.inc.cwl'), self.read_cwl('lib', 'inc.cwl'))
+
+    def test_changed_import_is_reconverted(self):
+        args = make_args(self.source, self.target, incremental=True)
+        main.process_directory(args)
+        wf_mtime = os.stat(os.path.join(self.target, 'wf', 'wf.cwl')).st_mtime_ns
+        self.write('lib.wdl', LIB_WDL.replace('+ 1', '+ 2'))
+        manifest = main.load_manifest(args)
+        entry = main.process_file(self.path('wf.wdl'), args, manifest.get(self.path('wf.wdl')))
+        self.assertNotEqual(entry, manifest.get(self.path('wf.wdl')))
+        self.assertIn('+ 2', self.read_cwl('wf', 'lib.inc.cwl')['arguments'][0]['valueFrom'])
+        # the workflow itself did not change
+        self.assertEqual(os.stat(os.path.join(self.target, 'wf', 'wf.cwl')).st_mtime_ns, wf_mtime)
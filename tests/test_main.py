@@ -0,0 +1,685 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import wdl_parser
+
+from wdl2cwl import main
+from wdl2cwl.parsers import VersionError
+from wdl2cwl.store import STORE_NAME
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+GATK_WRAPPERS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'examples', 'gatk_wrappers', 'WDLTasks_3.6')
+
+
+def make_args(workflow, directory, **kwargs):
+    args = argparse.Namespace(workflow=workflow,
+                              parser=wdl_parser.parsers['draft-2'],
+                              directory=directory,
+                              quiet=True,
+                              no_folder=False,
+                              jobs=1,
+                              cache_dir=None,
+                              cache_size=512,
+                              incremental=False,
+                              profile=False,
+                              pack=False,
+                              compact=False,
+                              prune=False,
+                              cwl_version='v1.0',
+                              read_tsv='expression',
+                              dedup=False)
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+def read_tree(directory):
+    tree = {}
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path) as f:
+                tree[os.path.relpath(path, directory)] = f.read()
+    return tree
+
+
+class ProcessDirectoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'wdl')
+        os.mkdir(self.source)
+        for name in sorted(os.listdir(GATK_WRAPPERS))[:8]:
+            shutil.copy(os.path.join(GATK_WRAPPERS, name), self.source)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_parallel_output_matches_serial(self):
+        serial = os.path.join(self.tmp, 'serial')
+        parallel = os.path.join(self.tmp, 'parallel')
+        main.process_directory(make_args(self.source, serial))
+        main.process_directory(make_args(self.source, parallel, jobs=2))
+        self.assertEqual(read_tree(serial), read_tree(parallel))
+        self.assertEqual(len(read_tree(serial)), 8)
+
+    def test_expression_tools_are_not_shared_between_files(self):
+        source = os.path.join(self.tmp, 'test-data')
+        target = os.path.join(self.tmp, 'cwl')
+        shutil.copytree(TEST_DATA, source)
+        main.process_directory(make_args(source, target))
+        tree = read_tree(target)
+        self.assertIn(os.path.join('ctask', 'read_tsv.cwl'), tree)
+        self.assertEqual([path for path in tree if path.endswith('read_tsv.cwl')],
+                         [os.path.join('ctask', 'read_tsv.cwl')])
+
+    def test_concurrent_conversions_in_threads(self):
+        names = ['ctask', 'scatter', 'task']
+        serial = os.path.join(self.tmp, 'serial')
+        threaded = os.path.join(self.tmp, 'threaded')
+        for name in names:
+            main.process_file(os.path.join(TEST_DATA, name + '.wdl'), make_args(None, serial))
+        threads = [threading.Thread(target=main.process_file,
+                                    args=(os.path.join(TEST_DATA, name + '.wdl'), make_args(None, threaded)))
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(read_tree(serial), read_tree(threaded))
+        self.assertEqual(os.getcwd(), self.cwd)
+
+
+class AstIndexTestCase(unittest.TestCase):
+
+    def test_index_matches_find_asts(self):
+        for name in ['ctask.wdl', 'scatter.wdl', 'task.wdl']:
+            with open(os.path.join(TEST_DATA, name)) as f:
+                ast = wdl_parser.parsers['draft-2'].parse(f.read()).ast()
+            index = main.AstIndex(ast)
+            for node_name in ['Task', 'Workflow', 'Call', 'Declaration', 'Scatter', 'RawCommand']:
+                self.assertEqual(index.find(node_name), main.find_asts(ast, node_name))
+
+
+class IncrementalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, 'wdl')
+        self.target = os.path.join(self.tmp, 'cwl')
+        shutil.copytree(TEST_DATA, self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def convert(self, **kwargs):
+        main.process_directory(make_args(self.source, self.target, incremental=True, **kwargs))
+        return dict((path, os.stat(os.path.join(self.target, path)).st_mtime_ns) for path in read_tree(self.target))
+
+    def test_unchanged_files_are_skipped(self):
+        first = self.convert()
+        self.assertIn(os.path.join('scatter', 'wf.cwl'), first)
+        self.assertEqual(self.convert(), first)
+
+    def test_only_changed_outputs_are_rewritten(self):
+        first = self.convert()
+        with open(os.path.join(self.source, 'scatter.wdl')) as f:
+            code = f.read()
+        with open(os.path.join(self.source, 'scatter.wdl'), 'w') as f:
+            f.write(code.replace('call sum {input: ints = inc2.incremented}', ''))
+        second = self.convert()
+        changed = sorted(path for path in second if path.endswith('.cwl') and second[path] != first[path])
+        self.assertEqual(changed, [os.path.join('scatter', 'wf.cwl')])
+
+    def test_changed_options_convert_again(self):
+        self.convert()
+        second = self.convert(no_folder=True)
+        self.assertIn('wf.cwl', second)
+        self.assertNotIn(os.path.join('scatter', 'wf.cwl'), second)
+        third = self.convert(no_folder=True, pack=True)
+        self.assertIn('scatter.cwl', third)
+        self.assertNotIn('wf.cwl', third)
+        self.convert(no_folder=True, pack=True, compact=True)
+        with open(os.path.join(self.target, 'scatter.cwl')) as f:
+            self.assertEqual(f.read().split('\n', 2)[2].strip().count('\n'), 0)
+        fourth = self.convert(dedup=True)
+        self.assertTrue(any(path.startswith(STORE_NAME + os.sep) for path in fourth))
+        tree = read_tree(self.target)
+        self.convert(dedup=True, prune=True)
+        self.assertNotEqual(read_tree(self.target), tree)
+        self.convert(dedup=True, prune=True, cwl_version='v1.2')
+        with open(os.path.join(self.target, 'scatter', 'wf.cwl')) as f:
+            self.assertIn('"cwlVersion": "v1.2"', f.read())
+        last = self.convert(dedup=True, prune=True, cwl_version='v1.2', read_tsv='command')
+        with open(os.path.join(self.target, 'ctask', 'count_lines4_wf.cwl')) as f:
+            self.assertIn('read_tsv_inputSamples-', f.read())
+
+    def test_changed_converter_converts_again(self):
+        self.convert()
+        with mock.patch('wdl2cwl.main.printstuff', wraps=main.printstuff) as printstuff:
+            self.convert()
+            self.assertEqual(printstuff.call_count, 0)
+            with mock.patch('wdl2cwl.manifest._converter_hash', 'another converter'):
+                self.convert()
+        sources = [name for name in os.listdir(self.source) if name.endswith('.wdl')]
+        self.assertEqual(printstuff.call_count, len(sources))
+
+    def test_stale_outputs_are_removed(self):
+        self.convert()
+        with open(os.path.join(self.source, 'scatter.wdl')) as f:
+            code = f.read()
+        with open(os.path.join(self.source, 'scatter.wdl'), 'w') as f:
+            f.write(code.replace('workflow wf', 'workflow renamed'))
+        second = self.convert()
+        self.assertIn(os.path.join('scatter', 'renamed.cwl'), second)
+        self.assertNotIn(os.path.join('scatter', 'wf.cwl'), second)
+
+
+class ConvertTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = wdl_parser.parsers['draft-2']
+        with open(os.path.join(TEST_DATA, 'ctask.wdl')) as f:
+            self.code = f.read()
+
+    def test_convert_source(self):
+        cwd = os.listdir(os.getcwd())
+        documents = main.convert(self.code, self.parser)
+        self.assertEqual(list(documents),
+                         ['wc2_tool.cwl', 'count_lines4_wf.cwl', 'count_lines4_wf_scatter_f.cwl', 'read_tsv.cwl'])
+        self.assertEqual(documents['wc2_tool.cwl']['class'], 'CommandLineTool')
+        self.assertEqual(documents['count_lines4_wf.cwl']['class'], 'Workflow')
+        self.assertIn('inputSamples', documents['read_tsv.cwl']['outputs'])
+        self.assertEqual(os.listdir(os.getcwd()), cwd)
+
+    def test_convert_ast(self):
+        ast = self.parser.parse(self.code).ast()
+        self.assertEqual(main.convert(ast), main.convert(self.code, self.parser))
+
+    def test_parser_is_detected(self):
+        self.assertEqual(main.convert(self.code), main.convert(self.code, self.parser))
+        self.assertRaises(VersionError, main.convert, 'task t {\n  input {\n    Int i\n  }\n  command { true }\n}')
+
+    def test_documents_are_streamed(self):
+        conversion = main.Conversion()
+        documents = main.iter_documents(self.code, self.parser, conversion=conversion)
+        filename, tool = next(documents)
+        self.assertEqual(filename, 'wc2_tool.cwl')
+        # the workflow is only converted once the tool has been consumed
+        self.assertEqual(conversion.expression_tools, [])
+        self.assertEqual(conversion.tasks['wc2_tool'], main.task_signature(tool))
+        self.assertEqual(sorted(conversion.tasks['wc2_tool']), ['id', 'inputs', 'outputs'])
+        self.assertEqual([name for name, document in documents],
+                         ['count_lines4_wf.cwl', 'count_lines4_wf_scatter_f.cwl', 'read_tsv.cwl'])
+
+
+WIRING_WDL = """
+task t {
+  File in_file
+  Int n
+  command {
+    tool ${n} ${in_file} > out_${n}.txt
+  }
+  output {
+    File out = "out_${n}.txt"
+  }
+  parameter_meta {
+    in_file: "input file"
+    n: "number"
+  }
+}
+
+workflow w {
+  File samples_file
+  Int n
+  Array[Array[File]] samples = read_tsv(samples_file)
+  scatter (s in samples) {
+    call t as scattered {input: in_file=s, n=1}
+    call t as chained {input: in_file=scattered.out, n=n}
+  }
+  call t {input: in_file=samples_file}
+  output {
+    t.*
+  }
+}
+"""
+
+
+class WorkflowWiringTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = main.convert(WIRING_WDL, wdl_parser.parsers['draft-2'])
+        self.steps = dict((step['id'], step) for step in self.documents['w.cwl']['steps'])
+
+    def test_parameter_meta(self):
+        self.assertEqual([inp.get('doc') for inp in self.documents['t.cwl']['inputs']], ['input file', 'number'])
+
+    def test_scatter_over_expression_tool_output(self):
+        self.assertEqual(self.steps['scatter_s']['in'][0], {'id': 's', 'source': 'read_tsv_1/samples'})
+        self.assertEqual(self.steps['scatter_s']['scatter'], ['s'])
+
+    def test_scatter_body_is_a_subworkflow(self):
+        self.assertEqual(self.steps['scatter_s']['run'], 'w_scatter_s.cwl')
+        self.assertEqual([step['id'] for step in self.documents['w.cwl']['steps']], ['read_tsv_1', 'scatter_s', 't'])
+        subworkflow = self.documents['w_scatter_s.cwl']
+        steps = dict((step['id'], step) for step in subworkflow['steps'])
+        # the chain runs per element, without waiting for the whole scatter
+        self.assertEqual(steps['chained']['in'][0], {'id': 'in_file', 'source': 'scattered/out'})
+        self.assertEqual(steps['chained']['in'][1], {'id': 'n', 'source': 'n'})
+        self.assertEqual(subworkflow['inputs'], [{'id': 's', 'type': 'Any'}, {'id': 'n', 'type': 'int'}])
+        self.assertIn({'id': 'n', 'source': 'n'}, self.steps['scatter_s']['in'])
+        self.assertEqual([out['id'] for out in self.steps['scatter_s']['out']], ['scattered_out', 'chained_out'])
+        requirements = [requirement['class'] for requirement in self.documents['w.cwl']['requirements']]
+        self.assertEqual(requirements, ['ScatterFeatureRequirement', 'SubworkflowFeatureRequirement'])
+
+    def test_scatter_outputs_are_gathered(self):
+        with open(os.path.join(TEST_DATA, 'scatter.wdl')) as f:
+            documents = main.convert(f.read(), wdl_parser.parsers['draft-2'])
+        steps = dict((step['id'], step) for step in documents['wf.cwl']['steps'])
+        self.assertEqual(steps['sum']['in'], [{'id': 'ints', 'source': 'scatter_i/inc2_incremented'}])
+        self.assertEqual(documents['wf.cwl']['outputs'][1], {'id': 'inc2_incremented',
+                                                             'type': {'type': 'array', 'items': 'int'},
+                                                             'outputSource': 'scatter_i/inc2_incremented'})
+        self.assertEqual(documents['wf_scatter_i.cwl']['inputs'], [{'id': 'i', 'type': 'int'}])
+
+    def test_scatters_over_the_same_item(self):
+        code = WIRING_WDL.replace('  call t {input: in_file=samples_file}', """  scatter (s in samples) {
+    call t as again {input: in_file=s, n=2}
+  }
+  call t {input: in_file=samples_file}""")
+        conversion = main.Conversion()
+        documents = dict(main.iter_documents(code, wdl_parser.parsers['draft-2'], conversion=conversion))
+        steps = documents['w.cwl']['steps']
+        self.assertEqual([step['id'] for step in steps], ['read_tsv_1', 'scatter_s', 'scatter_s_2', 't'])
+        self.assertEqual(steps[2]['in'][0], {'id': 's', 'source': 'read_tsv_1/samples'})
+        # the types of the task are looked up once for all the calls
+        self.assertEqual(conversion.task_types, {'t': ({'in_file': 'File', 'n': 'int'}, {'out': 'File'})})
+
+    def test_unbound_task_inputs_become_workflow_inputs(self):
+        self.assertEqual(self.steps['t']['in'][1], {'id': 'n', 'source': 't_n'})
+        self.assertIn({'id': 't_n', 'type': 'int'}, self.documents['w.cwl']['inputs'])
+
+    def test_wildcard_outputs(self):
+        self.assertEqual(self.documents['w.cwl']['outputs'],
+                         [{'id': 't_out', 'type': 'File', 'outputSource': 't/out'}])
+
+
+SUBWORKFLOW_WDL = """
+task t {
+  File in_file
+  String name
+  command {
+    cat ${in_file} > ${name}.txt
+  }
+  output {
+    File out = "${name}.txt"
+  }
+}
+
+workflow w {
+  Array[File] files
+  String prefix
+  scatter (f in files) {
+    String suffix = ".txt"
+    call t {input: in_file=f, name=sub(prefix, suffix, "")}
+  }
+}
+"""
+
+
+class ScatterSubworkflowTestCase(unittest.TestCase):
+
+    def test_expressions_refer_to_step_inputs(self):
+        subworkflow = main.convert(SUBWORKFLOW_WDL, wdl_parser.parsers['draft-2'])['w_scatter_f.cwl']
+        self.assertEqual([inp['id'] for inp in subworkflow['inputs']], ['f', 'suffix', 'prefix'])
+        step = subworkflow['steps'][0]
+        self.assertEqual(step['in'], [{'id': 'in_file', 'source': 'f'},
+                                      {'id': 'name', 'valueFrom': '$(inputs.prefix.replace(inputs.suffix, ""))'},
+                                      {'id': 'prefix', 'source': 'prefix'},
+                                      {'id': 'suffix', 'source': 'suffix'}])
+
+    @unittest.skipUnless(shutil.which('cwltool'), 'cwltool is not installed')
+    def test_unpacked_documents_are_valid(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, 'w.wdl')
+            with open(source, 'w') as f:
+                f.write(SUBWORKFLOW_WDL)
+            main.process_file(source, make_args(source, tmp))
+            for name in ['w_scatter_f.cwl', 'w.cwl']:
+                process = subprocess.Popen(['cwltool', '--validate', os.path.join(tmp, 'w', name)],
+                                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = process.communicate()[0].decode('utf-8')
+                self.assertEqual(process.returncode, 0, output)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class PackTestCase(unittest.TestCase):
+
+    def test_pack(self):
+        documents = main.convert(WIRING_WDL, wdl_parser.parsers['draft-2'])
+        packed = main.pack(documents.items())
+        self.assertEqual(packed['cwlVersion'], 'v1.0')
+        graph = dict((document['id'], document) for document in packed['$graph'])
+        self.assertEqual(sorted(graph), ['#read_tsv', '#t', '#w', '#w_scatter_s'])
+        self.assertTrue(all('cwlVersion' not in document for document in graph.values()))
+        steps = dict((step['id'], step) for step in graph['#w']['steps'])
+        self.assertEqual(steps['t']['run'], '#t')
+        self.assertEqual(steps['read_tsv_1']['run'], '#read_tsv')
+        self.assertEqual(steps['scatter_s']['run'], '#w_scatter_s')
+        self.assertEqual(steps['scatter_s']['in'][0]['source'], '#w/read_tsv_1/samples')
+        chained = graph['#w_scatter_s']['steps'][1]
+        self.assertEqual(chained['in'][0]['source'], '#w_scatter_s/scattered/out')
+        self.assertEqual(graph['#w']['outputs'][0]['outputSource'], '#w/t/out')
+        # the converted documents are left untouched
+        self.assertEqual(documents['w.cwl']['outputs'][0]['outputSource'], 't/out')
+
+    def test_packed_compact_file(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, 'scatter.wdl')
+            shutil.copy(os.path.join(TEST_DATA, 'scatter.wdl'), source)
+            main.process_file(source, make_args(source, tmp, pack=True, compact=True))
+            self.assertEqual(os.listdir(os.path.join(tmp, 'scatter')), ['scatter.cwl'])
+            with open(os.path.join(tmp, 'scatter', 'scatter.cwl')) as f:
+                header, comment, code = f.read().split('\n', 2)
+            self.assertEqual(code.strip().count('\n'), 0)
+            self.assertEqual(len(json.loads(code)['$graph']), 4)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class DedupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.output = tempfile.mkdtemp()
+        shutil.copy(os.path.join(TEST_DATA, 'scatter.wdl'), os.path.join(self.source, 'a.wdl'))
+        shutil.copy(os.path.join(TEST_DATA, 'scatter.wdl'), os.path.join(self.source, 'b.wdl'))
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.output)
+
+    def read_report(self):
+        with open(os.path.join(self.output, STORE_NAME, 'report.json')) as f:
+            return json.load(f)
+
+    def test_identical_tools_are_stored_once(self):
+        main.process_directory(make_args(self.source, self.output, dedup=True))
+        stored = sorted(name for name in os.listdir(os.path.join(self.output, STORE_NAME)) if name.endswith('.cwl'))
+        self.assertEqual(len(stored), 2)
+        for folder in ['a', 'b']:
+            self.assertEqual(sorted(os.listdir(os.path.join(self.output, folder))), ['wf.cwl', 'wf_scatter_i.cwl'])
+            runs = set()
+            for name in ['wf.cwl', 'wf_scatter_i.cwl']:
+                with open(os.path.join(self.output, folder, name)) as f:
+                    header, comment, code = f.read().split('\n', 2)
+                runs.update(step['run'] for step in json.loads(code)['steps'])
+            runs = sorted(runs - set(['wf_scatter_i.cwl']))
+            self.assertEqual(runs, ['../{0}/{1}'.format(STORE_NAME, name) for name in stored])
+        report = self.read_report()
+        self.assertEqual(sorted(report['duplicates']), stored)
+        self.assertEqual(report['conflicts'], {})
+
+    def test_stored_tools_are_replaced_atomically(self):
+        with mock.patch('wdl2cwl.main.os.replace', wraps=os.replace) as replace:
+            main.process_directory(make_args(self.source, self.output, dedup=True, jobs=1))
+        stored = [os.path.join(self.output, STORE_NAME, name)
+                  for name in os.listdir(os.path.join(self.output, STORE_NAME)) if name.endswith('.cwl')]
+        self.assertTrue(set(stored) <= set(call[0][1] for call in replace.call_args_list))
+        self.assertEqual([name for name in os.listdir(os.path.join(self.output, STORE_NAME))
+                          if name.endswith('.tmp')], [])
+
+    def test_different_tools_with_the_same_id_are_reported(self):
+        with open(os.path.join(self.source, 'b.wdl')) as f:
+            code = f.read()
+        with open(os.path.join(self.source, 'b.wdl'), 'w') as f:
+            f.write(code.replace('${i} + 1', '${i} + 2'))
+        main.process_directory(make_args(self.source, self.output, dedup=True))
+        report = self.read_report()
+        self.assertEqual(len(report['conflicts']), 1)
+        self.assertEqual(len(report['duplicates']), 1)
+
+
+LOWERING_WDL = """
+task t {
+  Array[File] bams
+  Array[Int] ints
+  String name = "out"
+  Int n = 2
+  File? reference
+  command {
+    tool INPUT=${sep=' INPUT=' bams} -n ${n} > ${name}.txt
+    python -c "print(${sep='+' ints})"
+  }
+  output {
+    File out = "${name}.txt"
+  }
+}
+
+workflow w {
+  Array[Array[File]] samples
+  scatter (s in samples) {
+    call t {input: bams=s, ints=[1, 2], n=3, reference="/data/ref.fa"}
+  }
+}
+"""
+
+
+class ExpressionLoweringTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = main.convert(LOWERING_WDL, wdl_parser.parsers['draft-2'])
+
+    def requirements(self, filename):
+        return [requirement['class'] for requirement in self.documents[filename]['requirements']]
+
+    def test_uses_javascript(self):
+        self.assertFalse(main.uses_javascript({'valueFrom': 'cat $(inputs.a.path) $(inputs.b[0]) > $(runtime.outdir)'}))
+        self.assertFalse(main.uses_javascript({'default': '$(1 + 1)'}))
+        self.assertTrue(main.uses_javascript({'valueFrom': '$(inputs.a + 1)'}))
+        self.assertTrue(main.uses_javascript([{'glob': '${return "x"}'}]))
+
+    def test_literal_defaults(self):
+        inputs = dict((inp['id'], inp) for inp in self.documents['t.cwl']['inputs'])
+        self.assertEqual(inputs['name']['default'], 'out')
+        self.assertEqual(inputs['n']['default'], 2)
+        step = self.documents['w_scatter_s.cwl']['steps'][0]
+        self.assertEqual([inp for inp in step['in'] if inp['id'] == 'n'], [{'id': 'n', 'default': 3}])
+        self.assertEqual([inp for inp in step['in'] if inp['id'] == 'reference'],
+                         [{'id': 'reference', 'default': {'class': 'File', 'path': '/data/ref.fa'}}])
+
+    def test_scattered_input_needs_no_expression(self):
+        step = self.documents['w_scatter_s.cwl']['steps'][0]
+        self.assertEqual([inp for inp in step['in'] if inp['id'] == 'bams'], [{'id': 'bams', 'source': 's'}])
+        self.assertEqual(self.requirements('w_scatter_s.cwl'), [])
+
+    def test_sep_is_bound_to_the_input(self):
+        code = LOWERING_WDL.replace('    python -c "print(${sep=\'+\' ints})"\n', '')
+        tool = main.convert(code, wdl_parser.parsers['draft-2'])['t.cwl']
+        self.assertEqual([requirement['class'] for requirement in tool['requirements']], ['ShellCommandRequirement'])
+        bams = [inp for inp in tool['inputs'] if inp['id'] == 'bams'][0]
+        self.assertEqual(bams['inputBinding'], {'position': 1, 'itemSeparator': ' INPUT=', 'shellQuote': False,
+                                                'prefix': 'INPUT=', 'separate': False})
+        self.assertEqual([argument['valueFrom'] for argument in tool['arguments']],
+                         ['tool', '-n $(inputs.n) > $(inputs.name).txt'])
+
+    def test_glued_sep_falls_back_to_javascript(self):
+        tool = self.documents['t.cwl']
+        self.assertEqual(self.requirements('t.cwl'), ['ShellCommandRequirement', 'InlineJavascriptRequirement'])
+        self.assertTrue(all('inputBinding' not in inp for inp in tool['inputs']))
+        self.assertEqual(len(tool['arguments']), 1)
+        self.assertTrue(tool['arguments'][0]['valueFrom'].endswith(
+            'return "tool INPUT=" + bams_separated + " -n " + inputs.n + " > " + inputs.name + '
+            '".txt\\npython -c \\"print(" + ints_separated + ")\\""}'))
+
+
+COMMAND_WDL = """
+task script {
+  command <<<
+    python3 <<CODE
+    total = 0
+    for i in range(3):
+        total += i
+
+    print(total)
+    CODE
+    echo done
+  >>>
+}
+
+task continued {
+  File f
+  Int n
+  command {
+    tool \\
+      --in ${f} \\
+      --n ${n}
+  }
+}
+"""
+
+
+class CommandTemplateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = main.convert(COMMAND_WDL, wdl_parser.parsers['draft-2'])
+
+    def test_script_keeps_its_lines(self):
+        command = self.documents['script.cwl']['arguments'][0]['valueFrom']
+        self.assertEqual(command, 'python3 <<CODE\ntotal = 0\nfor i in range(3):\n    total += i\n\nprint(total)\n'
+                                  'CODE\necho done')
+        self.assertEqual(subprocess.check_output(['sh', '-c', command]).decode().split(), ['3', 'done'])
+
+    def test_continued_lines_are_joined(self):
+        self.assertEqual(self.documents['continued.cwl']['arguments'],
+                         [{'valueFrom': 'tool --in $(inputs.f.path) --n $(inputs.n)', 'shellQuote': False}])
+
+
+RUNTIME_WDL = """
+task t {
+  String mem
+  Int disk_size
+  command {
+    tool
+  }
+  runtime {
+    docker: "ubuntu"
+    memory: "3500 MB"
+    cpu: "1.5"
+    disks: "local-disk 10 HDD, /mnt/ref 2 SSD"
+    preemptible: 3
+  }
+}
+
+task dynamic {
+  String mem
+  Int disk_size
+  Int threads
+  command {
+    tool
+  }
+  runtime {
+    memory: mem
+    cpu: threads
+    disks: "local-disk " + disk_size + " HDD"
+    preemptible: 0
+  }
+}
+"""
+
+
+class RuntimeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.documents = main.convert(RUNTIME_WDL, wdl_parser.parsers['draft-2'])
+
+    def resources(self, filename):
+        return [r for r in self.documents[filename]['requirements'] if r['class'] == 'ResourceRequirement'][0]
+
+    def test_literal_resources(self):
+        self.assertEqual(dict(self.resources('t.cwl')), {'class': 'ResourceRequirement', 'ramMin': 3338,
+                                                          'coresMin': 2, 'coresMax': 2,
+                                                          'outdirMin': 10240, 'tmpdirMin': 2048})
+        self.assertEqual(self.documents['t.cwl']['hints'], [{'class': 'arv:UsePreemptible', 'usePreemptible': True}])
+
+    def test_dynamic_resources(self):
+        resources = self.resources('dynamic.cwl')
+        self.assertEqual(resources['coresMin'], '$(inputs.threads)')
+        self.assertIn("size(inputs.mem, 'B')", resources['ramMin'])
+        self.assertIn('"local-disk " + inputs.disk_size + " HDD"', resources['outdirMin'])
+        self.assertNotIn('hints', self.documents['dynamic.cwl'])
+        self.assertIn({'class': 'InlineJavascriptRequirement'}, self.documents['dynamic.cwl']['requirements'])
+
+    def test_unrecognised_literals_do_not_fail(self):
+        code = RUNTIME_WDL.replace('"3500 MB"', '"lots"').replace('"1.5"', '"two"').replace('10 HDD', 'ten HDD')
+        with self.assertLogs('Main', 'WARNING') as logs:
+            tool = main.convert(code.replace('preemptible: 3', 'preemptible: "yes"\n    runtime_minutes: "soon"'),
+                                wdl_parser.parsers['draft-2'])['t.cwl']
+        self.assertEqual([r for r in tool['requirements'] if r['class'] == 'ResourceRequirement'],
+                         [{'class': 'ResourceRequirement', 'ramMin': 'lots'}])
+        self.assertNotIn('hints', tool)
+        self.assertEqual(len([line for line in logs.output if 'is not understood' in line]), 4)
+
+    def test_namespaces_are_packed_once(self):
+        packed = main.pack(self.documents.items())
+        self.assertEqual(packed['$namespaces'], {'arv': 'http://arvados.org/cwl#'})
+        self.assertTrue(all('$namespaces' not in document for document in packed['$graph']))
+
+
+READ_TSV_WDL = """
+workflow w {
+  File sheet
+%s
+}
+""" % '\n'.join('  Array[Array[File]] files_{0} = read_tsv(sheet)'.format(i) for i in range(11))
+
+
+class ReadTsvTestCase(unittest.TestCase):
+
+    def test_step_names(self):
+        documents = main.convert(READ_TSV_WDL, wdl_parser.parsers['draft-2'])
+        steps = documents['w.cwl']['steps']
+        self.assertEqual(sorted(step['id'] for step in steps), sorted('read_tsv_{0}'.format(i) for i in range(1, 12)))
+        # every declaration gets a tool returning its own output
+        runs = dict((step['out'][0], step['run']) for step in steps)
+        self.assertEqual((runs['files_0'], runs['files_1']), ('read_tsv.cwl', 'read_tsv_files_1.cwl'))
+        self.assertEqual(list(documents['read_tsv_files_1.cwl']['outputs']), ['files_1'])
+
+    def test_command_lowering(self):
+        documents = main.convert(READ_TSV_WDL, wdl_parser.parsers['draft-2'], read_tsv='command')
+        self.assertNotIn('read_tsv.cwl', documents)
+        tool = documents['read_tsv_files_0.cwl']
+        self.assertEqual(tool['class'], 'CommandLineTool')
+        self.assertEqual(tool['outputs'], [{'id': 'files_0',
+                                            'type': {'type': 'array', 'items': {'type': 'array', 'items': 'File'}}}])
+        self.assertEqual(tool['arguments'][1]['valueFrom'], 'File')
+
+    def test_command_streams_large_files(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            sheet = os.path.join(tmp, 'sheet.tsv')
+            with open(sheet, 'w') as f:
+                for i in range(10000):
+                    f.write('sample{0}\t/data/sample{0}.bam\n'.format(i))
+            self.assertGreater(os.path.getsize(sheet), 64 * 1024)
+            subprocess.check_call([sys.executable, '-c', main.READ_TSV_SCRIPT, sheet, 'rows', 'String'], cwd=tmp)
+            with open(os.path.join(tmp, 'cwl.output.json')) as f:
+                rows = json.load(f)['rows']
+            self.assertEqual(len(rows), 10000)
+            self.assertEqual(rows[-1], ['sample9999', '/data/sample9999.bam'])
+        finally:
+            shutil.rmtree(tmp)
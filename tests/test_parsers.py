@@ -0,0 +1,133 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import wdl_parser
+
+from wdl2cwl.imports import ImportGraph
+from wdl2cwl.parsers import PARSERS, VersionError, detect_version, load_parser, parser_name
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run_python(code, *args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.check_output([sys.executable, '-c', code] + list(args), env=env).decode('utf-8').split()
+
+
+class ParsersTestCase(unittest.TestCase):
+
+    def test_names_match_wdl_parser(self):
+        self.assertEqual(sorted(PARSERS), sorted(wdl_parser.parsers))
+        for name in PARSERS:
+            self.assertIs(load_parser(name), wdl_parser.parsers[name])
+            self.assertEqual(parser_name(load_parser(name)), name)
+        self.assertRaises(ValueError, load_parser, 'draft-1')
+
+    def test_only_the_chosen_grammar_is_imported(self):
+        loaded = run_python('import sys\n'
+                            'from wdl2cwl.parsers import load_parser\n'
+                            'parser = load_parser("draft-2")\n'
+                            'print(sorted(name for name in sys.modules if name.startswith("wdl_parser")))\n'
+                            'import wdl_parser\n'
+                            'print(wdl_parser.parsers["draft-2"] is parser)')
+        self.assertEqual(loaded, ["['wdl_parser.draft_2']", 'True'])
+
+    def test_command_line_imports_are_deferred(self):
+        loaded = run_python('import sys\n'
+                            'import wdl2cwl.main\n'
+                            'print(" ".join(name for name in ("wdl_parser", "jinja2", "multiprocessing")\n'
+                            '               if name in sys.modules) or "-")')
+        self.assertEqual(loaded, ['-'])
+
+
+DRAFT_2_WDL = """
+# a task without a version statement
+task t {
+  Int i
+  command { echo ${i} }
+}
+"""
+
+
+class DetectVersionTestCase(unittest.TestCase):
+
+    def test_version_statement(self):
+        self.assertEqual(detect_version('# comment\n\nversion 1.0\ntask t {\n  input {\n  }\n}\n'), '1.0')
+        self.assertEqual(detect_version('version draft-3\n'), 'draft-3')
+        self.assertEqual(detect_version('  version development  \n'), 'development')
+        self.assertEqual(detect_version('version 1.0  # pinned\n\ntask t {\n}\n'), '1.0')
+        self.assertEqual(detect_version('version draft-3# pinned\n'), 'draft-3')
+
+    def test_crlf_and_byte_order_mark(self):
+        self.assertEqual(detect_version('version 1.0\r\n\r\ntask t {\r\n}\r\n'), '1.0')
+        self.assertEqual(detect_version('# comment\r\nversion draft-3 # pinned\r\n'), 'draft-3')
+        self.assertEqual(detect_version('\ufeffversion 1.0\n'), '1.0')
+        self.assertEqual(detect_version('\ufeffversion 1.0\r\n'), '1.0')
+        with self.assertRaises(VersionError):
+            detect_version('\ufefftask t {\r\n}\r\nversion 1.0\r\n')
+
+    def test_files_are_parsed_without_byte_order_mark(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, 'bom.wdl')
+            with open(source, 'w', encoding='utf-8-sig', newline='\r\n') as f:
+                f.write('version 1.0\n' + DRAFT_2_WDL.replace('Int i', 'input {\n    Int i\n  }'))
+            graph = ImportGraph(lambda code, parser: parser.parse(code).ast())
+            self.assertIs(graph.parser_for(source), wdl_parser.parsers['1.0'])
+            self.assertEqual(graph.load(source).attr('body')[0].attr('name').source_string, 't')
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(detect_version(DRAFT_2_WDL), 'draft-2')
+        self.assertEqual(detect_version(''), 'draft-2')
+
+    def test_ambiguous_versions_are_reported(self):
+        with self.assertRaisesRegex(VersionError, r'^a\.wdl: WDL version 1\.1 is not supported'):
+            detect_version('version 1.1\n', 'a.wdl')
+        with self.assertRaisesRegex(VersionError, 'version statement on line 2 must come before'):
+            detect_version('import "lib.wdl"\nversion 1.0\n')
+        with self.assertRaisesRegex(VersionError, 'line 3 has an input section'):
+            detect_version('task t {\n\n  input {\n  }\n}\n')
+        with self.assertRaisesRegex(VersionError, 'line 1 has a struct'):
+            detect_version('struct Sample {\n  File bam\n}\n')
+
+    def test_versions_are_detected_once_per_file(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            files = {'a.wdl': DRAFT_2_WDL, 'b.wdl': 'version 1.0\n', 'c.wdl': 'version 1.1\n'}
+            for name, code in files.items():
+                with open(os.path.join(tmp, name), 'w') as f:
+                    f.write(code)
+            graph = ImportGraph(lambda code, parser: parser)
+            with mock.patch('wdl2cwl.imports.detect_version', wraps=detect_version) as detect:
+                graph.order([os.path.join(tmp, name) for name in sorted(files)])
+                self.assertIs(graph.load(os.path.join(tmp, 'a.wdl')), wdl_parser.parsers['draft-2'])
+                self.assertIs(graph.parser_for(os.path.join(tmp, 'b.wdl')), wdl_parser.parsers['1.0'])
+                self.assertRaises(VersionError, graph.load, os.path.join(tmp, 'c.wdl'))
+                self.assertRaises(VersionError, graph.parser_for, os.path.join(tmp, 'c.wdl'))
+            self.assertEqual(detect.call_count, 3)
+            # a parser given for the whole run is used for every file
+            graph = ImportGraph(lambda code, parser: parser, wdl_parser.parsers['draft-3'])
+            self.assertIs(graph.parser_for(os.path.join(tmp, 'c.wdl')), wdl_parser.parsers['draft-3'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_command_line_reports_ambiguous_files(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp, 'bad.wdl')
+            with open(source, 'w') as f:
+                f.write('task t {\n  input {\n  }\n}\n')
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            process = subprocess.Popen([sys.executable, '-m', 'wdl2cwl.main', source, '-q', '-d', tmp], env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+            self.assertEqual(process.returncode, 2)
+            self.assertIn('bad.wdl: no version statement (WDL draft-2), but line 2 has an input section',
+                          stderr.decode('utf-8'))
+        finally:
+            shutil.rmtree(tmp)
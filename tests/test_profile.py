@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import wdl_parser
+
+from wdl2cwl import main, profile
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(TEST_DATA, 'scatter.wdl')) as f:
+            self.code = f.read()
+        self.parser = wdl_parser.parsers['draft-2']
+
+    def test_handlers_are_recorded_only_while_active(self):
+        profiler = profile.Profiler()
+        with profile.activate(profiler):
+            with profile.source('scatter.wdl'):
+                main.convert(self.code, self.parser)
+        main.convert(self.code, self.parser)
+        self.assertIsNone(profile.current())
+        self.assertEqual(profiler.handlers['Task'][0], 2)
+        self.assertEqual(profiler.handlers['Workflow'][0], 1)
+        self.assertEqual(profiler.handlers['[parse]'][0], 1)
+        self.assertEqual(list(profiler.files), ['scatter.wdl'])
+        self.assertIn('scatter.wdl;Workflow;Scatter;Call;CallBody', profiler.stacks)
+
+    def test_cumulative_time_counts_recursion_once(self):
+        profiler = profile.Profiler()
+        with profile.activate(profiler):
+            main.convert(self.code, self.parser)
+        for name, (calls, cumulative, own) in profiler.handlers.items():
+            self.assertLessEqual(own, cumulative + 1e-9, name)
+        total = sum(own for calls, cumulative, own in profiler.handlers.values())
+        roots = profiler.handlers['[parse]'][1] + profiler.handlers['Task'][1] + profiler.handlers['Workflow'][1]
+        self.assertAlmostEqual(total, roots, places=6)
+
+    def test_merge_and_write(self):
+        profiler = profile.Profiler()
+        with profile.activate(profiler):
+            main.convert(self.code, self.parser)
+        merged = profile.Profiler()
+        merged.merge(profiler.data())
+        merged.merge(profiler.data())
+        self.assertEqual(merged.handlers['Task'][0], 4)
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'profile.txt')
+            merged.write(filename, 'collapsed')
+            with open(filename) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(len(lines), len(merged.stacks))
+            self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+        finally:
+            shutil.rmtree(tmp)
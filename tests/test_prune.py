@@ -0,0 +1,60 @@
+import os
+import unittest
+
+import wdl_parser
+
+from wdl2cwl import main
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+DEAD_STEP_WDL = """
+task inc {
+  Int i
+  command <<<
+  python -c "print(${i} + 1)"
+  >>>
+  output {
+    Int incremented = read_int(stdout())
+  }
+}
+
+workflow w {
+  Int unused
+  call inc {input: i=1}
+  call inc as dead {input: i=unused}
+  call inc as chained {input: i=inc.incremented}
+  output {
+    chained.incremented
+  }
+}
+"""
+
+
+class PruneTestCase(unittest.TestCase):
+
+    def convert(self, code, prune=True):
+        conversion = main.Conversion(prune=prune)
+        documents = dict(main.iter_documents(code, wdl_parser.parsers['draft-2'], conversion=conversion))
+        return documents, conversion.pruned
+
+    def test_only_final_outputs_are_exported(self):
+        with open(os.path.join(TEST_DATA, 'scatter.wdl')) as f:
+            documents, pruned = self.convert(f.read())
+        wf = documents['wf.cwl']
+        self.assertEqual([out['id'] for out in wf['outputs']], ['sum_sum'])
+        # the scatter subworkflow only returns what the workflow uses
+        self.assertEqual(wf['steps'][0]['out'], [{'id': 'inc2_incremented'}])
+        self.assertEqual([out['id'] for out in documents['wf_scatter_i.cwl']['outputs']], ['inc2_incremented'])
+        self.assertEqual(pruned, [('wf', 'output', 'inc_incremented'), ('wf', 'output', 'inc2_incremented')])
+
+    def test_dead_steps_are_removed(self):
+        documents, pruned = self.convert(DEAD_STEP_WDL)
+        wf = documents['w.cwl']
+        self.assertEqual([step['id'] for step in wf['steps']], ['inc', 'chained'])
+        self.assertEqual(wf['inputs'], [])
+        self.assertEqual(pruned, [('w', 'step', 'dead'), ('w', 'input', 'unused')])
+
+    def test_pruning_is_optional(self):
+        documents, pruned = self.convert(DEAD_STEP_WDL, prune=False)
+        self.assertEqual([step['id'] for step in documents['w.cwl']['steps']], ['inc', 'dead', 'chained'])
+        self.assertEqual(pruned, [])
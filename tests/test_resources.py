@@ -0,0 +1,25 @@
+import unittest
+
+from wdl2cwl.resources import mebibytes, parse_disks, parse_size
+
+
+class ResourcesTestCase(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('3500 MB'), 3.5e9)
+        self.assertEqual(parse_size('2GiB'), 2 * 1024 ** 3)
+        self.assertEqual(parse_size('0.5 g'), 5e8)
+        self.assertEqual(parse_size(1024), 1024)
+        self.assertEqual(parse_size('10', default_unit='GiB'), 10 * 1024 ** 3)
+        self.assertRaises(ValueError, parse_size, 'a lot')
+        self.assertRaises(ValueError, parse_size, '3 parsecs')
+
+    def test_parse_disks(self):
+        self.assertEqual(parse_disks('local-disk 100 HDD'), (100 * 1024 ** 3, 0))
+        self.assertEqual(parse_disks('local-disk 10 SSD, /mnt/ref 2 SSD, /mnt/tmp 500 MB'),
+                         (10 * 1024 ** 3, 2 * 1024 ** 3 + 5e8))
+        self.assertEqual(parse_disks('20 GB'), (2e10, 0))
+
+    def test_mebibytes(self):
+        self.assertEqual(mebibytes(3.5e9), 3338)
+        self.assertEqual(mebibytes(1024 ** 2), 1)
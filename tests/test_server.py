@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+import unittest
+
+import wdl_parser
+
+from wdl2cwl import main
+from wdl2cwl.server import ConversionServer, is_loopback, request_conversion
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+
+class ConversionServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ConversionServer(('127.0.0.1', 0))
+        self.url = 'http://127.0.0.1:{0}/convert'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_conversion(self):
+        with open(os.path.join(TEST_DATA, 'scatter.wdl')) as f:
+            code = f.read()
+        response = request_conversion(self.url, code, 'draft-2', render=True)
+        expected = main.convert(code, wdl_parser.parsers['draft-2'])
+        self.assertEqual([name for name, document in response['documents']], list(expected))
+        self.assertEqual(json.loads(json.dumps(expected)), dict(response['documents']))
+        self.assertEqual(dict(response['files'])['wf.cwl'], main.render_tool(expected['wf.cwl']))
+
+    def test_errors(self):
+        self.assertIn('error', request_conversion(self.url, 'task {', 'draft-2'))
+        self.assertIn('error', request_conversion(self.url, 'task {', 'no-such-version'))
+
+    def test_only_loopback_addresses_are_served(self):
+        for host in ['127.0.0.1', '127.0.0.2', '::1', 'localhost']:
+            self.assertTrue(is_loopback(host), host)
+        for host in ['0.0.0.0', '::', '192.168.1.10', '']:
+            self.assertFalse(is_loopback(host), host)
@@ -0,0 +1,80 @@
+import os
+import unittest
+
+import wdl_parser
+
+from wdl2cwl import main
+from wdl2cwl.versions import emit
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test-data')
+
+TASK_WDL = """
+task t {
+  Int minutes
+  command { date }
+  runtime {
+    runtime_minutes: 30
+  }
+  meta {
+    volatile: true
+  }
+  output {
+    String d = read_string(stdout())
+  }
+}
+
+task u {
+  Int minutes
+  command { date }
+  runtime {
+    runtime_minutes: minutes
+  }
+}
+"""
+
+
+class VersionsTestCase(unittest.TestCase):
+
+    def convert(self, code, version):
+        return main.convert(code, wdl_parser.parsers['draft-2'], cwl_version=version)
+
+    def hints(self, tool):
+        return [hint['class'] for hint in tool.get('hints', [])]
+
+    def test_v1_0_drops_newer_hints(self):
+        tool = self.convert(TASK_WDL, 'v1.0')['t.cwl']
+        self.assertEqual(tool['cwlVersion'], 'v1.0')
+        self.assertNotIn('hints', tool)
+        self.assertEqual([requirement['class'] for requirement in tool['requirements']], ['ShellCommandRequirement'])
+
+    def test_javascript_of_dropped_hints_is_not_required(self):
+        self.assertIn({'class': 'InlineJavascriptRequirement'}, self.convert(TASK_WDL, 'v1.1')['u.cwl']['requirements'])
+        tool = self.convert(TASK_WDL, 'v1.0')['u.cwl']
+        self.assertNotIn('hints', tool)
+        self.assertEqual([requirement['class'] for requirement in tool['requirements']], ['ShellCommandRequirement'])
+
+    def test_runtime_and_meta_hints(self):
+        documents = self.convert(TASK_WDL, 'v1.1')
+        self.assertEqual(documents['t.cwl']['hints'], [{'class': 'ToolTimeLimit', 'timelimit': 1800},
+                                                       {'class': 'WorkReuse', 'enableReuse': False}])
+        self.assertEqual(documents['u.cwl']['hints'],
+                         [{'class': 'ToolTimeLimit', 'timelimit': '$(Math.ceil(Number(inputs.minutes) * 60))'}])
+
+    def test_tools_do_not_list_directories(self):
+        with open(os.path.join(TEST_DATA, 'ctask.wdl')) as f:
+            documents = self.convert(f.read(), 'v1.2')
+        self.assertTrue(all(document['cwlVersion'] == 'v1.2' for document in documents.values()))
+        tool = documents['wc2_tool.cwl']
+        self.assertIn({'class': 'LoadListingRequirement', 'loadListing': 'no_listing'}, tool['requirements'])
+        self.assertIn({'class': 'NetworkAccess', 'networkAccess': True}, tool['requirements'])
+        self.assertEqual(documents['read_tsv.cwl']['inputs'], {'infile': {'type': 'File', 'loadContents': True}})
+        self.assertNotIn('NetworkAccess', [r['class'] for r in documents['read_tsv.cwl']['requirements']])
+
+    def test_emit_does_not_modify_the_document(self):
+        tool = {'class': 'CommandLineTool', 'cwlVersion': 'v1.0', 'requirements': [], 'inputs': [],
+                'hints': [{'class': 'WorkReuse', 'enableReuse': False}]}
+        self.assertEqual(emit(tool, 'v1.0')['cwlVersion'], 'v1.0')
+        self.assertEqual(len(emit(tool, 'v1.1')['requirements']), 2)
+        self.assertEqual(tool, {'class': 'CommandLineTool', 'cwlVersion': 'v1.0', 'requirements': [], 'inputs': [],
+                                'hints': [{'class': 'WorkReuse', 'enableReuse': False}]})
+        self.assertRaises(ValueError, emit, tool, 'v2.0')
@@ -0,0 +1,159 @@
+"""
+Persistent on-disk cache of parsed WDL documents.
+
+Entries are keyed by the hash of the WDL source together with the parser module used to parse it, so an unchanged
+file never has to be parsed again. The AST is stored as compressed JSON of nested lists (a much smaller structure
+than pickling the parser's own objects) and is rebuilt with the classes of the requested parser on load. Entries are
+never unpickled, as the cache directory may be shared (e.g. by CI jobs): an entry that cannot be decoded is a miss.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger('Main')
+
+CACHE_FORMAT = 2
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+def encode_ast(node):
+    """
+    Convert an AST into nested tuples made of builtin types only
+    """
+    cls = node.__class__.__name__
+    if cls == 'Ast':
+        return ('A', node.name, [(key, encode_ast(value)) for key, value in node.attributes.items()])
+    elif cls == 'Terminal':
+        return ('T', node.id, node.str, node.source_string, node.resource, node.line, node.col)
+    elif cls == 'AstList':
+        return ('L', [encode_ast(child) for child in node])
+    elif isinstance(node, list):
+        return ('l', [encode_ast(child) for child in node])
+    elif node is None:
+        return None
+    else:
+        raise TypeError('Cannot encode AST node of type {0}'.format(cls))
+
+
+def decode_ast(data, parser):
+    """
+    Rebuild an AST encoded by encode_ast using the node classes of the given parser module
+    """
+    if data is None:
+        return None
+    tag = data[0]
+    if tag == 'A':
+        return parser.Ast(data[1], OrderedDict((key, decode_ast(value, parser)) for key, value in data[2]))
+    elif tag == 'T':
+        return parser.Terminal(*data[1:])
+    elif tag == 'L':
+        return parser.AstList(decode_ast(child, parser) for child in data[1])
+    elif tag == 'l':
+        return [decode_ast(child, parser) for child in data[1]]
+    else:
+        raise ValueError('Unknown AST node tag {0!r}'.format(tag))
+
+
+class AstCache(object):
+    """
+    Directory of serialized ASTs with size-bounded LRU eviction. The modification time of an entry is its last use.
+    The directory is only listed on the first write and when the running total of the entry sizes exceeds max_size
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.size = None  # total size of the entries, unknown until the directory is listed
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, wdl_code, parser):
+        digest = hashlib.sha256()
+        digest.update('{0}:{1}:'.format(CACHE_FORMAT, parser.__name__).encode('utf-8'))
+        digest.update(wdl_code.encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ast')
+
+    def get(self, key, parser):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                ast = decode_ast(json.loads(zlib.decompress(f.read()).decode('utf-8')), parser)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logger.warning('Discarding corrupt cache entry {0}: {1}'.format(path, e))
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return ast
+
+    def put(self, key, ast):
+        data = zlib.compress(json.dumps(encode_ast(ast), separators=(',', ':')).encode('utf-8'))
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if self.size is not None:
+            self.size += len(data) - replaced
+        if self.size is None or self.size > self.max_size:
+            self.evict()
+
+    def parse(self, wdl_code, parser):
+        """
+        Return the AST of wdl_code, parsing it only if it is not cached yet
+        """
+        key = self.key(wdl_code, parser)
+        ast = self.get(key, parser)
+        if ast is not None:
+            self.hits += 1
+            return ast
+        self.misses += 1
+        ast = parser.parse(wdl_code).ast()
+        self.put(key, ast)
+        return ast
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into max_size, and recount its size (entries may also
+        have been written or removed by other processes)
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.ast'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue  # removed by a concurrent process
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.max_size:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total -= size
+        self.size = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,168 @@
+"""
+Resolution of WDL imports.
+
+An ImportGraph lives for a whole run. Every WDL file is parsed at most once, no matter how many files import it, and
+the tools converted from an imported file are kept so that they are only converted once too. The graph of imports
+between files is found with a cheap lexical scan, so that a batch can be ordered (imported files first) and an
+incremental run can tell that a file has to be converted again because one of its imports changed. The same scan
+detects the WDL version of every file, so that a run without --parser reads each file only once to pick its grammar.
+"""
+import logging
+import os
+import re
+
+from wdl2cwl.manifest import sha256
+from wdl2cwl.parsers import VersionError, detect_version, load_parser
+
+logger = logging.getLogger('Main')
+
+IMPORT_RE = re.compile(r'^\s*import\s+"([^"]+)"(?:\s+as\s+([A-Za-z_][A-Za-z0-9_]*))?', re.MULTILINE)
+
+
+def default_namespace(uri):
+    """
+    Namespace of an import without 'as': the file name without its extension
+    """
+    return os.path.splitext(os.path.basename(uri))[0]
+
+
+def resolve(uri, importer=None):
+    """
+    Return the absolute path of an imported file. Relative paths are resolved against the directory of the importing
+    file, or against the working directory if the importing source has no path
+    """
+    if '://' in uri:
+        raise NotImplementedError('Import of {0}: only local files can be imported'.format(uri))
+    base = os.path.dirname(os.path.abspath(importer)) if importer else os.getcwd()
+    return os.path.normpath(os.path.join(base, uri))
+
+
+class ImportGraph(object):
+
+    def __init__(self, parse, parser=None):
+        """
+        `parse(code, parser)` returns the AST of WDL source code. Files are parsed with `parser`, or with the grammar
+        of their version if it is None
+        """
+        self.parse = parse
+        self.parser = parser
+        self.hashes = {}  # {path: sha256 of the source}
+        self.versions = {}  # {path: name of the grammar of the file, or the VersionError of its detection}
+        self.edges = {}  # {path: [(namespace, imported path)]}
+        self.imported = set()  # paths imported by any scanned file
+        self.asts = {}  # {path: AST} of imported files, until their tools are converted
+        self.tools = {}  # {path: {task name: converted tool}}, filled by the converter
+
+    def scan(self, path):
+        """
+        Record the hash and the imports of a file without parsing it. Returns [(namespace, imported path)]
+        """
+        path = os.path.abspath(path)
+        if path not in self.edges:
+            with open(path, encoding='utf-8-sig') as f:
+                code = f.read()
+            self.hashes[path] = sha256(code)
+            if self.parser is None:
+                try:
+                    self.versions[path] = detect_version(code, os.path.basename(path))
+                except VersionError as e:
+                    self.versions[path] = e
+            self.edges[path] = [(namespace or default_namespace(uri), resolve(uri, path))
+                                for uri, namespace in IMPORT_RE.findall(code)]
+            self.imported.update(imported for namespace, imported in self.edges[path])
+        return self.edges[path]
+
+    def parser_for(self, path):
+        """
+        Return the parser module of a file: the parser of the graph, or the grammar detected from the version of the
+        file. Raises VersionError if the version cannot be detected
+        """
+        if self.parser is not None:
+            return self.parser
+        path = os.path.abspath(path)
+        self.scan(path)
+        version = self.versions[path]
+        if isinstance(version, VersionError):
+            raise version
+        return load_parser(version)
+
+    def load(self, path):
+        """
+        Return the AST of a file. The AST of a file that other files import is kept until release() is called, so
+        that converting the file itself and the tasks other files import from it only parses it once
+        """
+        path = os.path.abspath(path)
+        ast = self.asts.get(path)
+        if ast is None:
+            parser = self.parser_for(path)
+            with open(path, encoding='utf-8-sig') as f:
+                ast = self.parse(f.read(), parser)
+            if path in self.imported:
+                self.asts[path] = ast
+        return ast
+
+    def release(self, path):
+        self.asts.pop(os.path.abspath(path), None)
+
+    def source_hash(self, path):
+        path = os.path.abspath(path)
+        self.scan(path)
+        return self.hashes[path]
+
+    def dependencies(self, path):
+        """
+        Return the paths of all the files a file imports, directly or not, in the order they are first reached
+        """
+        path = os.path.abspath(path)
+        seen = set([path])
+        result = []
+        stack = [path]
+        while stack:
+            for namespace, imported in reversed(self.scan(stack.pop())):
+                if imported not in seen:
+                    seen.add(imported)
+                    result.append(imported)
+                    if os.path.isfile(imported):
+                        stack.append(imported)
+        return result
+
+    def import_hashes(self, path):
+        """
+        Return {path: sha256} of every file a file depends on (None for missing files)
+        """
+        return dict((imported, self.source_hash(imported) if os.path.isfile(imported) else None)
+                    for imported in self.dependencies(path))
+
+    def order(self, files):
+        """
+        Return files sorted so that every file comes after the files it imports, directly or through files that are
+        not in the list. Files that do not depend on each other keep their order. Import cycles are reported and
+        broken
+        """
+        files = [os.path.abspath(file) for file in files]
+        selected = set(files)
+        done = set()
+        result = []
+        for file in files:
+            if file in done:
+                continue
+            # iterative depth-first search: [file, imports left to visit]
+            stack = [[file, [imported for namespace, imported in self.scan(file)]]]
+            visiting = set([file])
+            while stack:
+                node, pending = stack[-1]
+                if pending:
+                    imported = pending.pop(0)
+                    if imported in visiting:
+                        logger.warning('Import cycle between {0} and {1}'.format(
+                            os.path.basename(node), os.path.basename(imported)))
+                    elif imported not in done and os.path.isfile(imported):
+                        visiting.add(imported)
+                        stack.append([imported, [i for namespace, i in self.scan(imported)]])
+                else:
+                    stack.pop()
+                    visiting.discard(node)
+                    done.add(node)
+                    if node in selected:
+                        result.append(node)
+        return result
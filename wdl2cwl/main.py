@@ -3,23 +3,38 @@ from __future__ import print_function
 import argparse
 import json
 import logging
+import math
 import os
 import re
 import sys
-
-import wdl_parser
-from jinja2 import Environment, FileSystemLoader
+import threading
+from collections import OrderedDict
+
+from io import StringIO
+
+from wdl2cwl import profile
+from wdl2cwl.cache import AstCache
+from wdl2cwl.imports import ImportGraph, default_namespace, resolve
+from wdl2cwl.manifest import (Manifest, converter_hash, file_sha256, is_fresh, make_entry, remove_stale_outputs,
+                              sha256)
+from wdl2cwl.parsers import BOM, PARSERS, VersionError, detect_version, load_parser, parser_name
+from wdl2cwl.prune import prune_workflow
+from wdl2cwl.requirements import set_requirement, uses_javascript
+from wdl2cwl.resources import js_local_disk_mebibytes, js_mebibytes, mebibytes, parse_disks, parse_size
+from wdl2cwl.store import STORE_NAME, StoreReport, ToolStore
+from wdl2cwl.versions import DEFAULT_VERSION, VERSIONS, emit
 
 __version__ = '0.2'
 
 handlers = {}
 
-# set up logging
+# set up logging, the handler is attached by main() so that library users configure logging themselves
 logger = logging.getLogger('Main')
 logger.setLevel(logging.INFO)
 ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
-logger.addHandler(ch)
+
+HEADER = '#!/usr/bin/env cwl-runner\n# This tool description was generated automatically by wdl2cwl ver. {0}\n\n'
 
 typemap = {"Int": "int",
            "File": "File",
@@ -46,6 +61,23 @@ def class_name(obj):
     return obj.__class__.__name__
 
 
+def literal_value(node):
+    """
+    Return the value of a WDL string or integer literal or of an array of them, or None if the node is anything else
+    (strings with placeholders included)
+    """
+    if class_name(node) == 'Terminal':
+        if node.str == 'integer':
+            return int(node.source_string)
+        if node.str == 'string' and '${' not in node.source_string:
+            return node.source_string
+    elif class_name(node) == 'Ast' and node.name == 'ArrayLiteral':
+        values = [literal_value(value) for value in node.attr('values')]
+        if None not in values:
+            return values
+    return None
+
+
 def find_asts(ast_root, name):
     nodes = []
     if class_name(ast_root) == 'AstList':
@@ -59,6 +91,30 @@ def find_asts(ast_root, name):
     return nodes
 
 
+class AstIndex(object):
+    """
+    Index of an AST built in a single iterative walk: all nodes grouped by their name, in the same order as find_asts
+    returns them
+    """
+    def __init__(self, ast_root):
+        self.nodes = {}
+        stack = [ast_root]
+        while stack:
+            node = stack.pop()
+            cls = class_name(node)
+            if cls == 'AstList':
+                stack.extend(reversed(node))
+            elif cls == 'Ast':
+                self.nodes.setdefault(node.name, []).append(node)
+                stack.extend(reversed(list(node.attributes.values())))
+
+    def find(self, name):
+        """
+        Return all nodes with the given name, e.g. 'Task' or 'Workflow'
+        """
+        return self.nodes.get(name, [])
+
+
 def ihandle(i, **kw):
     """
     Process a symbol. Terminals are converted into an appropriate Python representation, and nonterminals are processed
@@ -89,9 +145,64 @@ def ihandle(i, **kw):
         else:
             raise NotImplementedError("Unknown terminal '%s'" % i.str)
     else:
+        profiler = profile.current()
+        if profiler is not None:
+            return profiler.call(i.name, handlers[i.name], i, **kw)
         return handlers[i.name](i, **kw)
 
 
+class WorkflowIndex(object):
+    """
+    Id-keyed lookups of the steps and inputs of a workflow under construction, so that wiring inputs and outputs does
+    not rescan the lists of the CWL document. Steps and inputs must be added through add_step, add_subworkflow and
+    add_input to be found
+    """
+    def __init__(self):
+        self.steps = {}  # {step id: step}
+        self.step_ids = set()  # ids of the steps of the workflow, and of the steps moved into its scatter subworkflows
+        self.step_outputs = {}  # {output name: id of the step}, for steps listing their outputs as plain names
+        self.inputs = {}  # {input id: input}
+
+        self.scattered = {}  # {id of a step moved into a scatter subworkflow: id of the step running the subworkflow}
+        self.subworkflows = {}  # {id of a step running a scatter subworkflow: [ids of the steps it contains]}
+        self.default_outputs = False  # whether the outputs are all the call outputs (no WDL output section)
+
+    def add_step(self, step):
+        self.steps[step['id']] = step
+        self.step_ids.add(step['id'])
+        for out in step['out']:
+            if not isinstance(out, dict):
+                self.step_outputs[out] = step['id']
+
+    def add_subworkflow(self, step, index):
+        """
+        Register the steps of the scatter subworkflow run by a step (index is the WorkflowIndex of the subworkflow).
+        They are found by id as if they were steps of this workflow, with array outputs
+        """
+        self.subworkflows[step['id']] = list(index.steps)
+        self.step_ids.add(step['id'])
+        self.step_ids.update(index.steps)
+        for step_id, inner in index.steps.items():
+            self.steps[step_id] = dict(inner, scatter=step['scatter'], depth=inner.get('depth', 0) + 1)
+            self.scattered[step_id] = step['id']
+
+    def add_input(self, inp):
+        self.inputs[inp['id']] = inp
+
+    def source(self, source):
+        """
+        Redirect a reference to an output of a step ('#step/output' or 'step/output') to the output of the scatter
+        subworkflow the step was moved into, if any
+        """
+        if isinstance(source, list):
+            return [self.source(s) for s in source]
+        prefix = '#' if source.startswith('#') else ''
+        step_id, _, output = source[len(prefix):].partition('/')
+        if output and step_id in self.scattered:
+            return '{0}{1}/{2}_{3}'.format(prefix, self.scattered[step_id], step_id, output)
+        return source
+
+
 def handleDocument(item, **kwargs):
     defs = []
     for i in item.attr("imports"):
@@ -102,7 +213,20 @@ def handleDocument(item, **kwargs):
 
 
 def handleImport(item, **kwargs):
-    raise NotImplementedError('Import not implemented')
+    """
+    Make the tasks of an imported WDL file callable as <namespace>.<task name>. Returns the namespace
+    """
+    conversion = kwargs['conversion']
+    uri = item.attr('uri')
+    if class_name(uri) == 'Ast':  # StaticString since draft-3
+        uri = uri.attr('value')
+    namespace = item.attr('namespace')
+    namespace = namespace.source_string if namespace is not None else default_namespace(uri.source_string)
+    path = resolve(uri.source_string, conversion.source)
+    conversion.namespaces[namespace] = path
+    for name, tool in imported_tools(conversion.imports, path).items():
+        conversion.tasks['{0}.{1}'.format(namespace, name)] = task_signature(tool)
+    return namespace
 
 
 def handleTask(item, **kwargs):
@@ -110,8 +234,7 @@ def handleTask(item, **kwargs):
             "class": "CommandLineTool",
             "cwlVersion": "v1.0",
             "baseCommand": [],
-            "requirements": [{"class": "ShellCommandRequirement"},
-                             {"class": "InlineJavascriptRequirement"}],
+            "requirements": [{"class": "ShellCommandRequirement"}],
             "inputs": [],
             "outputs": []}
 
@@ -126,6 +249,7 @@ def handleTask(item, **kwargs):
         ihandle(i, context=tool, assignments=kwargs.get("assignments", {}),
                 filevars=filevars, **kwargs)
 
+    set_requirement(tool, 'InlineJavascriptRequirement', uses_javascript(tool), position=1)
     return tool
 
 
@@ -139,54 +263,173 @@ def handleWorkflow(item, **kwargs):
           "cwlVersion": "v1.0",
           "inputs": [],
           "outputs": [],
-          "requirements": [
-              {"class": "InlineJavascriptRequirement"}
-          ],
+          "requirements": [],
           "steps": []}
+    kwargs['workflow_index'] = WorkflowIndex()
+    convert_workflow_body(item.attr("body"), wf, **kwargs)
+    conversion = kwargs['conversion']
+    if conversion.prune:
+        subworkflows = OrderedDict(conversion.subworkflows)
+        prune_workflow(wf, subworkflows, kwargs['workflow_index'].default_outputs, conversion.pruned)
+        conversion.subworkflows = list(subworkflows.items())
+    return wf
+
+
+def convert_workflow_body(body, wf, **kwargs):
+    """
+    Fill the inputs, steps, outputs and requirements of wf from the body of a workflow or of a scatter block
+    """
     assignments = {}
     filevars = set()
-    for i in item.attr("body"):
+    workflow_index = kwargs['workflow_index']
+    for i in body:
         if i.name == "Call":
-            wf["steps"].append(ihandle(i, context=wf, assignments=assignments,
-                                       filevars=filevars, **kwargs))
+            step = ihandle(i, context=wf, assignments=assignments, filevars=filevars, **kwargs)
+            wf["steps"].append(step)
+            workflow_index.add_step(step)
         elif i.name == "Declaration":
             # NO! declarations can be expressions of other inputs and thus must not be treated as inputs
             inp = ihandle(i, context=wf, assignments=assignments,
                           filevars=filevars, **kwargs)
             if inp:
                 wf["inputs"].append(inp)
+                workflow_index.add_input(inp)
         elif i.name == "WorkflowOutputs":
             wf["outputs"] = ihandle(i, context=wf, **kwargs)
         elif i.name == "Scatter":
-            wf["steps"].extend(ihandle(i, context=wf, assignments=assignments,
-                                       filevars=filevars, **kwargs))
+            wf["steps"].append(ihandle(i, context=wf, assignments=assignments, filevars=filevars, **kwargs))
         else:
             raise NotImplementedError
 
     if wf['outputs'] == []:
+        workflow_index.default_outputs = True
         for step in wf['steps']:
-            copy_step_outputs_to_workflow_outputs(step, wf['outputs'], **kwargs)
-    return wf
+            for step_id in workflow_index.subworkflows.get(step['id'], [step['id']]):
+                copy_step_outputs_to_workflow_outputs(workflow_index.steps.get(step_id, step), wf['outputs'], **kwargs)
+    if workflow_index.scattered:
+        # outputs of steps moved into scatter subworkflows are outputs of the steps running the subworkflows
+        for step in wf['steps']:
+            if isinstance(step['in'], list):
+                for inp in step['in']:
+                    if 'source' in inp:
+                        inp['source'] = workflow_index.source(inp['source'])
+        for out in wf['outputs']:
+            if 'outputSource' in out:
+                out['outputSource'] = workflow_index.source(out['outputSource'])
+    set_requirement(wf, 'InlineJavascriptRequirement', uses_javascript(wf), position=0)
+    set_requirement(wf, 'StepInputExpressionRequirement',
+                    any('valueFrom' in inp for step in wf['steps'] if isinstance(step['in'], list) for inp in step['in']))
 
 
 def handleRuntime(item, **kwargs):
+    resources = OrderedDict()  # fields of the ResourceRequirement
     for runtimeRequirement in item.attr('map'):
         key = ihandle(runtimeRequirement.attr('key'))
-        if key == 'docker':
-            value = ihandle(runtimeRequirement.attr('value'))
-            if type(value) is list:
-                value = value[0]  # if there are several Docker images, pick the first one (due to CWL restrictions)
-            kwargs['context']['requirements'].append({
-                'class': 'DockerRequirement',
-                'dockerPull': strip_special_ch(value)
-            })
-        elif key == 'memory':
-            kwargs['context']['requirements'].append({
-                'class': 'ResourceRequirement',
-                'ramMin': strip_special_ch(ihandle(runtimeRequirement.attr('value')))
-            })
+        value = runtimeRequirement.attr('value')
+        try:
+            convert_runtime_attribute(key, value, resources, **kwargs)
+        except (TypeError, ValueError):
+            # a literal that cannot be converted is handled as before the runtime section was converted
+            if key == 'memory':
+                logger.warning('Field "memory" is passed through, its value {0} is not a size'.format(ihandle(value)))
+                resources['ramMin'] = strip_special_ch(ihandle(value))
+            else:
+                logger.warning('Field "{0}" is ignored, its value {1} is not understood'.format(key, ihandle(value)))
+    if resources:
+        requirement = OrderedDict([('class', 'ResourceRequirement')])
+        requirement.update(resources)
+        kwargs['context']['requirements'].append(requirement)
+
+
+def convert_runtime_attribute(key, node, resources, **kwargs):
+    """
+    Convert an attribute of a runtime section: the fields of the ResourceRequirement go to `resources`, requirements
+    and hints to the tool. Raises ValueError (or TypeError) before changing anything if a literal value cannot be
+    converted
+    """
+    if key == 'docker':
+        value = ihandle(node)
+        if type(value) is list:
+            value = value[0]  # if there are several Docker images, pick the first one (due to CWL restrictions)
+        kwargs['context']['requirements'].append({
+            'class': 'DockerRequirement',
+            'dockerPull': strip_special_ch(value)
+        })
+    elif key == 'memory':
+        resources['ramMin'] = runtime_size(node, parse_size, js_mebibytes, **kwargs)
+    elif key == 'cpu':
+        resources['coresMin'] = resources['coresMax'] = runtime_cores(node, **kwargs)
+    elif key == 'disks':
+        value = literal_value(node)
+        if isinstance(value, str):
+            local, other = parse_disks(value)
+            resources['outdirMin'] = mebibytes(local)
+            if other:
+                resources['tmpdirMin'] = mebibytes(other)
         else:
-            logger.warning('Field "{0}" is ignored'.format(key))
+            resources['outdirMin'] = js_local_disk_mebibytes(runtime_expression(node, **kwargs))
+    elif key == 'runtime_minutes':
+        # not part of the WDL specification, but understood by several backends
+        kwargs['context'].setdefault('hints', []).append(
+            {'class': 'ToolTimeLimit', 'timelimit': runtime_seconds(node, **kwargs)})
+    elif key == 'preemptible':
+        value = literal_value(node)
+        if value is None:
+            logger.warning('Field "preemptible" is ignored, its value is only known at run time')
+        elif int(value) > 0:
+            tool = kwargs['context']
+            tool.setdefault('$namespaces', {})['arv'] = 'http://arvados.org/cwl#'
+            tool.setdefault('hints', []).append({'class': 'arv:UsePreemptible', 'usePreemptible': True})
+    else:
+        logger.warning('Field "{0}" is ignored'.format(key))
+
+
+def runtime_expression(node, **kwargs):
+    """
+    Return the JavaScript expression of the value of a runtime attribute
+    """
+    if class_name(node) == 'Terminal' and node.str == 'string':
+        # placeholders of a string become concatenations
+        return re.sub(r'\$\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}', r'" + inputs.\1 + "', json.dumps(node.source_string))
+    return ihandle(node, in_expression=True, filevars=kwargs.get('filevars', set()))
+
+
+def runtime_size(node, parse, js, **kwargs):
+    """
+    Return the mebibytes of a runtime size attribute: a number if the size is a literal, an expression otherwise
+    """
+    value = literal_value(node)
+    if value is not None:
+        return mebibytes(parse(value))
+    return js(runtime_expression(node, **kwargs))
+
+
+def runtime_cores(node, **kwargs):
+    value = literal_value(node)
+    if value is not None:
+        return int(math.ceil(float(value)))
+    if class_name(node) == 'Terminal' and node.str == 'identifier':
+        return '$(inputs.{0})'.format(node.source_string)
+    return '$(Math.ceil(Number({0})))'.format(runtime_expression(node, **kwargs))
+
+
+def runtime_seconds(node, **kwargs):
+    """
+    Return the seconds of a number of minutes
+    """
+    value = literal_value(node)
+    if value is not None:
+        return int(math.ceil(float(value) * 60))
+    return '$(Math.ceil(Number({0}) * 60))'.format(runtime_expression(node, **kwargs))
+
+
+def handleMeta(item, **kwargs):
+    for attribute in item.attr('map'):
+        key, value = ihandle(attribute.attr('key')), attribute.attr('value')
+        if key == 'volatile':
+            if class_name(value) == 'Terminal' and value.source_string.strip('"\'') == 'true':
+                # the results of the task must not be reused (call caching in WDL)
+                kwargs['context'].setdefault('hints', []).append({'class': 'WorkReuse', 'enableReuse': False})
 
 
 def handleType(item, **kwargs):
@@ -221,8 +464,16 @@ def handleDeclaration(item, context=None, assignments=None, filevars=None, **kwa
             filevars.add(param_id)
         return {"id": param_id,
                 "type": param_type}
+    elif literal_value(expression) is not None:
+        default = literal_value(expression)
+        if param_type == "File":
+            default = {"class": "File", "path": default}
+        return {"id": param_id,
+                "type": param_type,
+                "default": default}
     else:
         kwargs['outputName'] = param_id
+        kwargs['outputType'] = param_type
         result = ihandle(expression, **kwargs)
         if result:
             # if result[0] in {'\'', '"'}  # expression is string
@@ -238,42 +489,134 @@ def handleDeclaration(item, context=None, assignments=None, filevars=None, **kwa
 
 
 def handleRawCommand(item, context=None, **kwargs):
-    s = body = ''
-    symbols = []
-    parts = item.attr('parts')
-    if 'python' in ihandle(parts[0]):
-        for i, part in enumerate(parts):
-            # TODO: python commands
-            pass
-        pass
-    for p in parts:
-        kwargs['command'] = s
-        part = ihandle(p, **kwargs)
-        if type(part) is list:
-            body += part[0]
-            s += part[1]
-            symbols.append(part[1])
-        else:
-            s += part
-    if body:  # if the expr. is a function body, not a simple expr.
-        symbols.append('\$\(.*?\)')
-        l = re.split('(' + '|'.join(symbols) + ')', s)
-        res = []
-        for k in l:
-            if k in set(symbols[:-1]):
-                res.append(k)
-            elif '$' in k:
-                res.append(re.sub('[$()]', '', k))
+    template = CommandTemplate(item.attr('parts'), **kwargs)
+    if template.separated and not template.script:
+        arguments = bind_separated_inputs(template.segments(), context)
+        if arguments is not None:
+            context["arguments"] = arguments
+            return
+    context["arguments"] = [{"valueFrom": template.value(), "shellQuote": False}]
+
+
+class CommandTemplate(object):
+    """
+    A task command tokenized in one pass over the parts of its RawCommand: ('text', text), ('reference', expression)
+    for $(...) parameter references and ('separated', parameter, separator, preprocessing, variable) for ${sep=...}
+    placeholders. Commands embedding a script (a heredoc or python -c) keep their lines, with the indentation common
+    to all lines removed as WDL does; the lines of other commands are joined
+    """
+    SCRIPT_RE = re.compile(r'<<-?\s*[\'"]?\w+|(?<![\w.])python[\d.]*\s+-c\b')
+
+    def __init__(self, parts, **kwargs):
+        self.tokens = tokens = []
+        self.separated = False
+        pieces = []  # the command, with the variables of the separated inputs
+        for p in parts:
+            part = ihandle(p, **kwargs)
+            if type(part) is list:
+                preprocessing, variable, parameter, separator = part
+                tokens.append(('separated', parameter, separator, preprocessing, variable))
+                pieces.append(variable)
+                self.separated = True
             else:
-                res.append("\"" + k + "\"")
-        s = ' + '.join(res)
-        result = '${' + body + 'return ' + s + '}'
-    else:
-        result = s
-    result = re.sub(r'\\\n\s*', '', result)
-    result = result.strip()
-    result = result.replace('\n', '')
-    context["arguments"] = [{"valueFrom": result, "shellQuote": False}]
+                tokens.append(('text', part) if p.__class__.__name__ == 'Terminal' else ('reference', part[2:-1]))
+                pieces.append(part)
+        self.command = ''.join(pieces)
+        self.script = ('<<' in self.command or 'python' in self.command) and \
+            self.SCRIPT_RE.search(self.command) is not None
+        self.indent = ''
+        if self.script:
+            lines = [line for line in self.command.split('\n')[1:] if line.strip()]
+            self.indent = os.path.commonprefix([re.match(r'[ \t]*', line).group() for line in lines])
+
+    def segments(self):
+        """
+        Return the command as text (with the parameter references) and (parameter, separator) of the separated inputs,
+        see bind_separated_inputs
+        """
+        return [token[1] if token[0] == 'text' else '$(' + token[1] + ')' if token[0] == 'reference' else token[1:3]
+                for token in self.tokens]
+
+    def clean(self, text):
+        """
+        Join the lines of a text of the command, or remove their common indentation if the command embeds a script
+        """
+        if self.script:
+            return re.sub(r'\n(?:{0}|[ \t]*(?=\n))'.format(re.escape(self.indent)), '\n', text)
+        return re.sub(r'\\\n\s*', '', text).replace('\n', '')
+
+    def value(self):
+        """
+        Return the valueFrom of the command: the command itself, or a JavaScript function body building it if
+        separated inputs cannot be bound
+        """
+        if not self.separated:
+            return self.clean(self.command).strip()
+        body = ''.join(token[3] for token in self.tokens if token[0] == 'separated')
+        terms = []
+        for position, token in enumerate(self.tokens):
+            if token[0] == 'text':
+                text = self.clean(token[1])
+                if position == 0:
+                    text = text.lstrip()
+                if position == len(self.tokens) - 1:
+                    text = text.rstrip()
+                if text:
+                    terms.append(json.dumps(text))
+            elif token[0] == 'reference':
+                terms.append(token[1])
+            else:
+                terms.append(token[4])
+        return clean_command('${' + body + 'return ' + ' + '.join(terms or ['""']) + '}')
+
+
+def clean_command(command):
+    command = re.sub(r'\\\n\s*', '', command)
+    command = command.strip()
+    return command.replace('\n', '')
+
+
+def bind_separated_inputs(segments, tool):
+    """
+    Split a command with ${sep=...} placeholders into arguments and bind the separated arrays to the tool inputs
+    with an itemSeparator, so that the command needs no JavaScript. Text glued to the front of a placeholder becomes
+    the prefix of the binding. Returns the arguments, or None (leaving the tool untouched) if a placeholder is glued to
+    the text after it, is not a tool input or separates the same input twice
+    """
+    merged = []
+    for segment in segments:
+        if isinstance(segment, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += segment
+        else:
+            merged.append(segment)
+    inputs = dict((inp['id'], inp) for inp in tool['inputs'])
+    bindings = {}
+    arguments = []
+    for position, segment in enumerate(merged):
+        if isinstance(segment, str):
+            if position + 1 < len(merged) and not segment[-1:].isspace():
+                # the last word of the text is glued to the placeholder that follows
+                segment, prefix = re.match(r'(.*?)(\S*)$', segment, re.DOTALL).groups()
+                if '$' in prefix or '"' in prefix or "'" in prefix:
+                    return None
+                if prefix:
+                    merged[position + 1] += (prefix,)
+            command = clean_command(segment)
+            if command:
+                arguments.append({"valueFrom": command, "shellQuote": False, "position": position})
+            continue
+        parameter, separator = segment[:2]
+        following = merged[position + 1] if position + 1 < len(merged) else ' '
+        if parameter not in inputs or parameter in bindings or not isinstance(following, str) \
+                or not following[:1].isspace():
+            return None
+        binding = {"position": position, "itemSeparator": separator, "shellQuote": False}
+        if len(segment) > 2:
+            binding.update({"prefix": segment[2], "separate": False})
+        bindings[parameter] = binding
+    for parameter, binding in bindings.items():
+        inputs[parameter]["inputBinding"] = binding
+    return arguments
 
 
 def handleCommandParameter(item, context=None, **kwargs):
@@ -294,7 +637,7 @@ def handleCommandParameter(item, context=None, **kwargs):
                        ihandle(option.attr('value')).replace('\"', ""),
                        string)
 
-            return [preprocessing, string]
+            return [preprocessing, string, parameter, ihandle(option.attr('value')).replace('\"', "")]
 
     return "$(" + ihandle(item.attr("expr"), in_expression=True, depends_on=set(), **kwargs) + ")"
 
@@ -322,8 +665,52 @@ def handleOutputs(item, context=None, **kwargs):
         context["outputs"].append(out)
 
 
+# Streams a TSV file into cwl.output.json, one row at a time: read_tsv.py <file> <output name> <File|String>
+READ_TSV_SCRIPT = '''import json
+import sys
+
+path, name, cell_type = sys.argv[1:4]
+with open(path) as rows, open('cwl.output.json', 'w') as out:
+    out.write('{' + json.dumps(name) + ': [')
+    separator = ''
+    for line in rows:
+        line = line.rstrip('\\r\\n')
+        if not line:
+            continue
+        cells = line.split('\\t')
+        if cell_type == 'File':
+            cells = [{'class': 'File', 'path': cell} for cell in cells]
+        out.write(separator + json.dumps(cells))
+        separator = ','
+    out.write(']}')
+'''
+
+
+def read_tsv_tool(output_name, output_type=None):
+    """
+    Return a CommandLineTool reading a TSV file into the output `output_name` of type `output_type` (the declared type
+    of the WDL declaration, an array of arrays of strings by default). It has no size limit, unlike the loadContents
+    of the read_tsv expression tool
+    """
+    if not output_type or output_type == 'Any':
+        output_type = {'type': 'array', 'items': {'type': 'array', 'items': 'string'}}
+    cell_type = output_type
+    while isinstance(cell_type, dict):
+        cell_type = cell_type.get('items')
+    cell_type = 'File' if str(cell_type).rstrip('[]?') == 'File' else 'String'
+    return {"id": 'read_tsv_' + output_name,
+            "class": "CommandLineTool",
+            "cwlVersion": "v1.0",
+            "baseCommand": ["python3", "-c", READ_TSV_SCRIPT],
+            "requirements": [],
+            "hints": [{"class": "DockerRequirement", "dockerPull": "python:3-slim"}],
+            "inputs": [{"id": "infile", "type": "File", "inputBinding": {"position": 1}}],
+            "arguments": [{"position": 2, "valueFrom": output_name},
+                          {"position": 3, "valueFrom": cell_type}],
+            "outputs": [{"id": output_name, "type": output_type}]}
+
+
 def handleFunctionCall(item, **kwargs):
-    global expression_tools
     function_name = ihandle(item.attr("name"))
 
     if function_name == "stdout":
@@ -342,18 +729,28 @@ def handleFunctionCall(item, **kwargs):
     elif function_name == "read_tsv":
         try:
             params = [ihandle(param, **kwargs) for param in item.attr('params')]
-            tool_name = step_name = 'read_tsv'
-            tool_file = tool_name + '.cwl'
-            # handling duplicate step names due to hypothetical multiple expr. tools calls
-            if kwargs['context'].get('steps', ''):
-                read_tsv_steps = [step['id'] for step in kwargs['context']['steps'] if step['id'].startswith(step_name)]
-            else:
-                read_tsv_steps = None
-            if not read_tsv_steps:
-                step_name += '_1'
-            else:
-                step_name += str(int(read_tsv_steps[-1][-1]) + 1)  # if there are step_1, step_2 - create step_3
+            # steps are numbered in the order of the declarations: read_tsv_1, read_tsv_2, ..., read_tsv_10
+            numbers = [int(match.group(1)) for match in
+                       (re.match(r'read_tsv_(\d+)$', step['id']) for step in kwargs['context'].get('steps', []))
+                       if match]
+            step_name = 'read_tsv_{0}'.format(max(numbers) + 1 if numbers else 1)
             output_name = kwargs['outputName']
+            conversion = kwargs['conversion']
+            if conversion.read_tsv == 'command':
+                tool = read_tsv_tool(output_name, kwargs.get('outputType'))
+                tool_file = tool['id'] + '.cwl'
+                conversion.function_tools.append((tool_file, tool))
+            else:
+                tool_file = 'read_tsv.cwl'
+                SUBSTITUTIONS = {'outputs': ('outputArray', output_name),
+                                 'expression': ('outputArray', output_name)}
+                if any(file == tool_file and substitutions != SUBSTITUTIONS
+                       for file, substitutions in conversion.expression_tools):
+                    # read_tsv.cwl already returns another declaration, this one gets its own copy
+                    tool_file = 'read_tsv_{0}.cwl'.format(output_name)
+                    conversion.function_tools.append((tool_file, load_expression_tool('read_tsv.cwl', SUBSTITUTIONS)))
+                else:
+                    conversion.expression_tools.append((tool_file, SUBSTITUTIONS))
             # TODO: params[0] - looks like magic
             read_tsv_step = {'id': step_name,
                              'run': tool_file,
@@ -362,10 +759,7 @@ def handleFunctionCall(item, **kwargs):
                              'out': [output_name]
                              }
             kwargs['context']['steps'].insert(0, read_tsv_step)
-            SUBSTITUTIONS = {'outputs': ('outputArray', output_name),
-                             'expression': ('outputArray', output_name)}
-
-            expression_tools.append((tool_file, SUBSTITUTIONS))
+            kwargs['workflow_index'].add_step(read_tsv_step)
         except:
             pass
 
@@ -384,7 +778,7 @@ def handleCall(item, context=None, assignments=None, **kwargs):
     if item.attr("alias") is not None:
         stepid = ihandle(item.attr("alias"))
     else:
-        stepid = ihandle(item.attr("task")).strip('#')
+        stepid = ihandle(item.attr("task")).strip('#').split('.')[-1]
 
     step = {"id": stepid,
             "in": [],
@@ -402,14 +796,15 @@ def handleCall(item, context=None, assignments=None, **kwargs):
     if b is not None:
         ihandle(b, context=step, assignments=assignments, **kwargs)
 
+    bound = set(stepinp["id"] for stepinp in step["in"])
     for taskinp in kwargs["tasks"][ihandle(item.attr("task")).strip('#')]["inputs"]:
-        f = [stepinp for stepinp in step["in"] if stepinp["id"] == taskinp["id"]]
-        if not f and taskinp.get("default") is None:
+        if taskinp["id"] not in bound and taskinp.get("default") is None:
             newinp = "%s_%s" % (stepid, taskinp["id"])
             context["inputs"].append({
                 "id": newinp,
                 "type": taskinp["type"]
             })
+            kwargs["workflow_index"].add_input(context["inputs"][-1])
             step["in"].append({
                 "id": taskinp["id"],
                 "source": "%s" % (newinp)
@@ -424,73 +819,208 @@ def handleCallBody(item, **kwargs):
 
 
 def handleScatter(item, **kwargs):
-    scatter_requirements = [{'class': 'ScatterFeatureRequirement'},
-                            {'class': 'StepInputExpressionRequirement'}]
-    if scatter_requirements not in kwargs['context']['requirements']:
-        kwargs['context']['requirements'].extend(scatter_requirements)
-    # TODO: smart scattering (over subworkflows rather than individual steps)
-    steps = []
+    """
+    Convert a scatter block into a subworkflow made of the body of the block, run by a single step scattered over the
+    collection: every element goes through the whole body without waiting for the other elements at each call
+    """
+    wf = kwargs['context']
+    workflow_index = kwargs['workflow_index']
+    scatter_item = ihandle(item.attr('item'))
+    collection = ihandle(item.attr('collection'))
+
+    step_id = 'scatter_' + scatter_item
+    n = 1
+    while step_id in workflow_index.step_ids:
+        n += 1
+        step_id = 'scatter_{0}_{1}'.format(scatter_item, n)
+    subwf = {"id": '{0}_{1}'.format(wf['id'], step_id),
+             "class": "Workflow",
+             "cwlVersion": "v1.0",
+             "inputs": [],
+             "outputs": [],
+             "requirements": [],
+             "steps": []}
+    source, item_type = scatter_source(collection, **kwargs)
+    subwf['inputs'].append({'id': scatter_item, 'type': item_type})
+    body_index = WorkflowIndex()
+    body_index.add_input(subwf['inputs'][0])
+    step = {"id": step_id,
+            "in": [{"id": scatter_item, "source": source}],
+            "out": [],
+            "run": subwf['id'] + '.cwl',
+            "scatter": [scatter_item]}
+
+    body_kwargs = dict((key, value) for key, value in kwargs.items()
+                       if key not in ('context', 'assignments', 'filevars'))
+    body_kwargs.update(workflow_index=body_index, scatter_item=scatter_item)
+    convert_workflow_body(item.attr('body'), subwf, **body_kwargs)
+    lift_subworkflow_inputs(subwf, step, wf, **kwargs)
+    step['out'] = [{'id': out['id']} for out in subwf['outputs']]
+    workflow_index.add_subworkflow(step, body_index)
+    kwargs['conversion'].subworkflows.append((step['run'], subwf))
+
+    set_requirement(wf, 'ScatterFeatureRequirement', True)
+    set_requirement(wf, 'SubworkflowFeatureRequirement', True)
+    return step
 
-    for task in item.attr('body'):
-        if task.name == 'Declaration':
-            kwargs['context']['inputs'].append(ihandle(task, **kwargs))
-        elif task.name == 'Call':
-            tool_name = ihandle(task.attr("task")).strip('#')
-            alias = task.attr("alias")
-            if alias is not None:
-                stepid = ihandle(alias)
-            else:
-                stepid = tool_name
-            step = {"id": stepid,
-                    "in": [],
-                    "out": [],
-                    "run": tool_name + '.cwl'}
-            scatter_vars = [ihandle(item.attr('item')), ihandle(item.attr('collection'))]
-
-            # Explanation: in WDL - scatter (scatter_vars[0] in scatter_vars[1])
-            kwargs['scatter_vars'] = scatter_vars
-            kwargs['scatter_inputs'] = []
-            kwargs['step'] = step
-            for out in kwargs["tasks"][tool_name]["outputs"]:
-                step["out"].append({"id": out["id"]})
-
-            b = task.attr("body")
-            if b is not None:
-                ihandle(b, **kwargs)
-            scatter_inputs = kwargs['scatter_inputs']
-            if type(scatter_inputs) is list and len(scatter_inputs) > 1:
-                step['scatterMethod'] = 'dotproduct'
-            step.update({"scatter": kwargs['scatter_inputs']})
-            steps.append(step)
-        else:
-            raise NotImplementedError
-    return steps
+
+def array_items(param_type):
+    """
+    Return the type of the elements of an array type ('Any' if it is not an array)
+    """
+    if isinstance(param_type, dict) and param_type.get('type') == 'array':
+        return param_type['items']
+    if isinstance(param_type, str) and param_type.rstrip('?').endswith('[]'):
+        return param_type.rstrip('?')[:-2]
+    return 'Any'
+
+
+def task_types(step, **kwargs):
+    """
+    Return the types of the inputs and outputs of the task a step runs, ({input id: type}, {output id: type}), both
+    empty if the step does not run a task. They are built once per task and kept in the Conversion
+    """
+    name = step['run'][:-len('.cwl')]
+    types = kwargs['conversion'].task_types.get(name)
+    if types is None:
+        task = kwargs['tasks'].get(name)
+        if task is None:
+            return {}, {}
+        types = (dict((inp['id'], inp['type']) for inp in task['inputs']),
+                 dict((out['id'], out['type']) for out in task['outputs']))
+        kwargs['conversion'].task_types[name] = types
+    return types
+
+
+def step_input_type(step, name, **kwargs):
+    """
+    Return the type of an input of the tool a step runs ('Any' if unknown)
+    """
+    return task_types(step, **kwargs)[0].get(name, 'Any')
+
+
+def step_output_type(step, output, **kwargs):
+    """
+    Return the type of an output of a step ('Any' if unknown), an array for each scatter the step is run in
+    """
+    output_type = task_types(step, **kwargs)[1].get(output, 'Any')
+    if output_type != 'Any':
+        for level in range(step.get('depth', 1) if 'scatter' in step else 0):
+            output_type = {'type': 'array', 'items': output_type}
+    return output_type
+
+
+def scatter_source(collection, **kwargs):
+    """
+    Return the source of the collection of a scatter block and the type of its elements
+    """
+    workflow_index = kwargs['workflow_index']
+    step_id, _, output = collection.partition('/')
+    if output and step_id in workflow_index.steps:
+        return (workflow_index.source('#' + collection),
+                array_items(step_output_type(workflow_index.steps[step_id], output, **kwargs)))
+    if collection in workflow_index.step_outputs:
+        return '#{0}/{1}'.format(workflow_index.step_outputs[collection], collection), 'Any'
+    if collection in workflow_index.inputs:
+        return collection, array_items(workflow_index.inputs[collection]['type'])
+    return collection, 'Any'
+
+
+# string literals, and names in JavaScript expressions (with their "inputs." prefix, if any)
+JS_REFERENCE_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|(?<![\w.$])(inputs\.)?([A-Za-z_]\w*)')
+
+
+def lift_subworkflow_inputs(subwf, step, wf, **kwargs):
+    """
+    Turn what the steps of a scatter subworkflow take from the enclosing workflow (its inputs and the outputs of its
+    steps) into inputs of the subworkflow, passed by the step running it
+    """
+    workflow_index = kwargs['workflow_index']
+    inputs = dict((inp['id'], inp) for inp in subwf['inputs'])
+    outer_inputs = workflow_index.inputs
+    own_steps = set(inner['id'] for inner in subwf['steps'])
+    passed = set(inp['id'] for inp in step['in'])
+
+    def _pass(name, param_type, source):
+        if name not in inputs:
+            inputs[name] = {'id': name, 'type': param_type}
+            subwf['inputs'].append(inputs[name])
+        if name not in passed:
+            passed.add(name)
+            step['in'].append({'id': name, 'source': source})
+
+    def _lift(source):
+        if isinstance(source, list):
+            return [_lift(s) for s in source]
+        if source.startswith('#'):
+            step_id, _, output = source[1:].partition('/')
+            if step_id in own_steps:
+                return source
+            name = '{0}_{1}'.format(step_id, output)
+            outer_step = workflow_index.steps.get(step_id)
+            _pass(name, step_output_type(outer_step, output, **kwargs) if outer_step else 'Any',
+                  workflow_index.source(source))
+            return name
+        if source not in inputs:
+            _pass(source, outer_inputs[source]['type'] if source in outer_inputs else 'Any', source)
+        return source
+
+    # inputs the subworkflow cannot compute itself become inputs of the enclosing workflow
+    for inp in subwf['inputs'][1:]:
+        if 'default' not in inp:
+            if inp['id'] not in outer_inputs:
+                wf['inputs'].append(dict(inp))
+                workflow_index.add_input(wf['inputs'][-1])
+            _pass(inp['id'], inp['type'], inp['id'])
+    for inner in subwf['steps']:
+        if isinstance(inner['in'], list):
+            for inp in inner['in']:
+                if 'source' in inp:
+                    inp['source'] = _lift(inp['source'])
+        else:  # {input id: source}, see read_tsv
+            for key, source in inner['in'].items():
+                inner['in'][key] = _lift(source)
+
+    # expressions only see the inputs of their step: inputs of the subworkflow they use are passed to the step under
+    # the same name and referred to as inputs.<name>
+    for inner in subwf['steps']:
+        if not isinstance(inner['in'], list):
+            continue
+        step_inputs = set(inp['id'] for inp in inner['in'])
+
+        def _reference(match):
+            name = match.group(2)
+            if name is None or name not in inputs and name not in outer_inputs:
+                return match.group(0)
+            if name not in inputs:
+                _pass(name, outer_inputs[name]['type'], name)
+            if name not in step_inputs:
+                step_inputs.add(name)
+                inner['in'].append({'id': name, 'source': name})
+            return 'inputs.' + name
+
+        for inp in list(inner['in']):
+            if 'valueFrom' in inp:
+                inp['valueFrom'] = JS_REFERENCE_RE.sub(_reference, inp['valueFrom'])
 
 
 def handleIOMapping(item, context=None, assignments=None, filevars=None, **kwargs):
     mp = {"id": ihandle(item.attr("key"))}
 
-    scatter_vars = kwargs.get('scatter_vars', '')
+    scatter_item = kwargs.get('scatter_item')
 
     value = ihandle(item.attr("value"))
-    if value.endswith(']'):
-        wdl_var = value[:-3]
-    else:
-        wdl_var = value
-    if scatter_vars and ((wdl_var == scatter_vars[0]) or scatter_vars[0] in wdl_var):
-        kwargs['scatter_inputs'].append(mp['id'])
-        source = 'inputs'
-        for step in context['steps']:
-            if scatter_vars[1] in step['out']:
-                source = step['id']
-        if source != 'inputs':
-            mp["source"] = "#{0}/{1}".format(source, scatter_vars[1])
-        else:
-            mp['source'] = scatter_vars[1]
-        if scatter_vars[1] in mp.get("source", ""):
-            mp["valueFrom"] = "$(" + ihandle(item.attr("value"),
-                                             in_expression=False,
-                                             filevars=filevars).replace(scatter_vars[0], "self") + ")"
+    if scatter_item and re.search(r'(?<![\w/.]){0}\b'.format(re.escape(scatter_item)), value):
+        # in a scatter subworkflow, the element is the input of the subworkflow named after the scatter item
+        mp['source'] = scatter_item
+        value_from = re.sub(r'(?<![\w/.]){0}\b'.format(re.escape(scatter_item)), 'self',
+                            ihandle(item.attr("value"), in_expression=False, filevars=filevars))
+        if value_from != "self":  # the element itself needs no expression
+            mp["valueFrom"] = "$(" + value_from + ")"
+    elif literal_value(item.attr("value")) is not None:
+        mp['default'] = literal_value(item.attr("value"))
+        if step_input_type(context, mp['id'], **kwargs) in ("File", "File?"):
+            mp['default'] = {"class": "File", "path": mp['default']}
     else:
         value_is_literal = hasattr(item.attr("value"), 'str') and \
                            ((item.attr('value').str == 'string') or item.attr('value').str == 'integer')
@@ -502,10 +1032,7 @@ def handleIOMapping(item, context=None, assignments=None, filevars=None, **kwarg
         else:
             mp['source'] = value
 
-    if scatter_vars:
-        kwargs['step']["in"].append(mp)
-    else:
-        context['in'].append(mp)
+    context['in'].append(mp)
 
 
 def handleWorkflowOutputs(item, **kwargs):
@@ -517,9 +1044,9 @@ def handleWorkflowOutputs(item, **kwargs):
                 if key == 'wildcard':
                     if ihandle(value) == '*':
                         # asterisk means that all outputs from the task must be copied to workflow outputs
-                        for step in kwargs['context']['steps']:
-                            if step['id'] == cwl_output['source_step'].strip('#'):
-                                copy_step_outputs_to_workflow_outputs(step, outputs, **kwargs)
+                        step = kwargs['workflow_index'].steps.get(cwl_output['source_step'].strip('#'))
+                        if step is not None:
+                            copy_step_outputs_to_workflow_outputs(step, outputs, **kwargs)
                     del cwl_output['source_step']
                 elif key == 'fqn':
                     res = ihandle(value)
@@ -542,26 +1069,13 @@ def handleWorkflowOutputs(item, **kwargs):
 
 
 def copy_step_outputs_to_workflow_outputs(step, outputs, **kwargs):
-    def _find_type():
-        task = kwargs['tasks'].get(step['id'], "")
-        if task:
-            for output_param in task['outputs']:
-                if output_param['id'] == id:
-                    if 'scatter' in step:
-                        return {'type': 'array',
-                                'items': output_param['type']}
-                    else:
-                        return output_param['type']
-        else:
-            return "Any"
-
     for output in step['out']:
         if type(output) is dict:
             id = output['id']
         else:
             id = output
         outputs.append({"id": step['id'] + '_' + id,
-                        "type": _find_type(),
+                        "type": step_output_type(step, id, **kwargs),
                         "outputSource": '#' + step['id'] + '/' + id})
 
 
@@ -583,14 +1097,13 @@ def handleOptionalType(item, **kwargs):
 
 
 def handleParameterMeta(item, **kwargs):
-    inputs = set(el['id'] for el in kwargs['context']['inputs'])
+    inputs = {}
+    for inp in kwargs['context']['inputs']:
+        inputs.setdefault(inp['id'], inp)
     for el in item.attr('map'):
         key, value = ihandle(el, **kwargs)
         if key in inputs:
-            for i, inp in enumerate(kwargs['context']['inputs']):
-                if inp['id'] == key:
-                    kwargs['context']['inputs'][i]['doc'] = value.strip('\'"')
-                    break
+            inputs[key]['doc'] = value.strip('\'"')
 
 
 def handleRuntimeAttribute(item, **kwargs):
@@ -623,104 +1136,598 @@ for k, v in m.__dict__.copy().items():
     if k.startswith("handle"):
         handlers[k[6:]] = v
 
-env = Environment(
-    loader=FileSystemLoader(os.path.abspath(os.path.join(os.path.dirname(__file__), 'templates'))),
-    trim_blocks=True,
-    lstrip_blocks=True)
-main_template = env.get_template('cwltool.j2')
-expression_tools = []  # [(file, SUBSTITUTIONS)] // SUBSTITUTIONS = {'path/to/substitute', (term, sub)}
+
+class Conversion(object):
+    """
+    State of a single conversion. Handlers reach it through the 'conversion' keyword argument, so that several
+    conversions can run side by side (e.g. in threads) without sharing anything but the read-only handler tables
+    """
+    def __init__(self, directory=None, quiet=False, imports=None, source=None, prune=False,
+                 cwl_version=DEFAULT_VERSION, read_tsv='expression'):
+        self.directory = directory or os.getcwd()
+        self.quiet = quiet
+        self.imports = imports  # ImportGraph shared by the conversions of a run
+        self.source = source  # path of the WDL file, imports are resolved relative to it
+        self.namespaces = {}  # {namespace: path of the imported file}
+        self.tasks = {}  # {task name: signature of the converted tool}, see task_signature
+        self.task_types = {}  # {task name: ({input id: type}, {output id: type})}, see task_types
+        self.index = None
+        self.outputs = {}  # {filename: sha256 of the content}
+        self.tools = []  # [(tool id, canonical hash, stored name)] of the tools written to a ToolStore
+        self.expression_tools = []  # [(file, SUBSTITUTIONS)] // SUBSTITUTIONS = {'path/to/substitute', (term, sub)}
+        self.subworkflows = []  # [(file, CWL workflow)] of the bodies of scatter blocks
+        self.prune = prune  # whether to remove unused outputs, steps and inputs from workflows, see prune.py
+        self.pruned = []  # [(workflow id, 'output'|'step'|'input', id)] removed by the pruning pass
+        self.cwl_version = cwl_version  # version the documents are emitted for, see versions.py
+        self.read_tsv = read_tsv  # lowering of read_tsv: 'expression' (ExpressionTool) or 'command' (read_tsv_tool)
+        self.function_tools = []  # [(file, CWL tool)] built for the WDL functions of a workflow
+
+
+def task_signature(tool):
+    """
+    Return the part of a converted tool that calls are wired with: the ids and types of its inputs and outputs and
+    whether an input has a default. Only this is kept in memory once the tool has been written
+    """
+    inputs = []
+    for inp in tool['inputs']:
+        signature = {'id': inp['id'], 'type': inp['type']}
+        if inp.get('default') is not None:
+            signature['default'] = inp['default']
+        inputs.append(signature)
+    return {'id': tool['id'],
+            'inputs': inputs,
+            'outputs': [{'id': out['id'], 'type': out['type']} for out in tool['outputs']]}
+
+
+def imported_tools(imports, path):
+    """
+    Return the tools converted from the tasks of an imported WDL file, {task name: tool}. They are converted on first
+    use, unless the file was already converted in the same run (see convert_documents), and kept in the ImportGraph
+    for the other files of the run that import the same file
+    """
+    tools = imports.tools.get(path)
+    if tools is None:
+        conversion = Conversion(imports=imports, source=path)
+        conversion.index = AstIndex(imports.load(path))
+        tools = OrderedDict()
+        for task_ast in conversion.index.find('Task'):
+            tools[ihandle(task_ast.attr("name"))] = ihandle(task_ast, conversion=conversion)
+        imports.tools[path] = tools
+        imports.release(path)
+    return tools
+
+
+def parse(wdl_code, parser, cache=None):
+    """
+    Parse WDL source code into an abstract syntax tree, going through the parse cache if one is given
+    """
+    with profile.phase('parse'):
+        if cache is not None:
+            return cache.parse(wdl_code, parser)
+        return parser.parse(wdl_code).ast()
+
+
+def iter_documents(wdl, parser=None, cache=None, conversion=None):
+    """
+    Convert WDL source code, an AST already produced by a WDL parser or an AstIndex of one to CWL without touching
+    the filesystem. Source code is parsed with `parser`, or with the grammar of its version statement if it is None
+    (see parsers.detect_version). Yields (file name, CWL document) pairs as soon as each document is converted: tasks first, then
+    the imported tasks that are called ('<namespace>.<task>.cwl'), then every workflow followed by the subworkflows
+    of its scatter blocks and the expression tools it runs
+    """
+    if conversion is None:
+        conversion = Conversion()
+    for filename, document in convert_documents(wdl, parser, cache, conversion):
+        yield filename, emit(document, conversion.cwl_version)
 
 
-def printstuff(wdl_code, parser, directory=os.getcwd(), quiet=False):
-    # Parse source code into abstract syntax tree
-    ast = parser.parse(wdl_code).ast()
-    # print(ast.dumps(indent=2))
+def convert_documents(wdl, parser, cache, conversion):
+    """
+    Body of iter_documents: yields the documents as the handlers build them, before they are adapted to the CWL
+    version of the conversion
+    """
+    if conversion.imports is None:
+        conversion.imports = ImportGraph(lambda code, file_parser: parse(code, file_parser, cache), parser)
+    if isinstance(wdl, AstIndex):
+        conversion.index = wdl
+    elif isinstance(wdl, str):
+        if wdl.startswith(BOM):
+            wdl = wdl[len(BOM):]
+        if parser is None:
+            source = os.path.basename(conversion.source) if conversion.source else None
+            parser = load_parser(detect_version(wdl, source))
+        conversion.index = AstIndex(parse(wdl, parser, cache))
+    else:
+        # print(wdl.dumps(indent=2))
+        conversion.index = AstIndex(wdl)
 
-    tasks = {}
+    tasks = conversion.tasks
+    # the tools of a file other files import are shared through the ImportGraph, so they are converted only once
+    source = os.path.abspath(conversion.source) if conversion.source else None
+    converted = conversion.imports.tools.get(source)
+    shared = OrderedDict() if converted is None and source in conversion.imports.imported else None
 
     # Find all 'Task' ASTs
-    task_asts = find_asts(ast, 'Task')
+    task_asts = conversion.index.find('Task')
     for task_ast in task_asts:
-        tool = ihandle(task_ast)
-        # cwl.append(a)
-        export_tool(tool, directory, quiet=quiet)
-        tasks[ihandle(task_ast.attr("name"))] = tool
+        name = ihandle(task_ast.attr("name"))
+        tool = converted[name] if converted is not None else ihandle(task_ast, conversion=conversion)
+        if shared is not None:
+            shared[name] = tool
+        tasks[name] = task_signature(tool)
+        yield '{0}.cwl'.format(tool['id']), tool
+    if shared is not None:
+        conversion.imports.tools[source] = shared
+        conversion.imports.release(source)
+
+    for import_ast in conversion.index.find('Import'):
+        ihandle(import_ast, conversion=conversion)
+    called = set()
+    for call_ast in conversion.index.find('Call'):
+        task_name = call_ast.attr('task').source_string
+        namespace, _, name = task_name.rpartition('.')
+        if namespace in conversion.namespaces and task_name not in called:
+            called.add(task_name)
+            tools = conversion.imports.tools[conversion.namespaces[namespace]]
+            if name not in tools:
+                raise ValueError('No task {0} in {1}'.format(name, conversion.namespaces[namespace]))
+            yield '{0}.cwl'.format(task_name), tools[name]
 
     # Find all 'Workflow' ASTs
-    workflow_asts = find_asts(ast, 'Workflow')
+    workflow_asts = conversion.index.find('Workflow')
+    emitted = 0
     for workflow_ast in workflow_asts:
-        wf = ihandle(workflow_ast, tasks=tasks)
-        export_tool(wf, directory, quiet)
+        wf = ihandle(workflow_ast, tasks=tasks, conversion=conversion)
+        yield '{0}.cwl'.format(wf['id']), relative_references(wf)
+        runs = set(step['run'] for step in wf['steps'])
+        for subworkflow_file, subworkflow in conversion.subworkflows:
+            runs.update(step['run'] for step in subworkflow['steps'])
+            yield subworkflow_file, relative_references(subworkflow)
+        del conversion.subworkflows[:]
+        for tool_file, tool in conversion.function_tools:
+            if tool_file in runs:
+                yield tool_file, tool
+        del conversion.function_tools[:]
+        for tool_file, substitutions in conversion.expression_tools[emitted:]:
+            if tool_file in runs:  # the steps running it may have been pruned
+                yield tool_file, load_expression_tool(tool_file, substitutions)
+        emitted = len(conversion.expression_tools)
+
+
+def convert(wdl, parser=None, cache=None, prune=False, cwl_version=DEFAULT_VERSION, read_tsv='expression'):
+    """
+    Convert WDL source code (or an already parsed AST) to CWL in memory.
+    Returns an ordered mapping of file names to CWL documents (dicts), as printstuff would write them
+    """
+    conversion = Conversion(prune=prune, cwl_version=cwl_version, read_tsv=read_tsv)
+    return OrderedDict(iter_documents(wdl, parser, cache, conversion))
+
+
+def relative_references(wf):
+    """
+    Return a copy of a workflow whose step inputs and outputs refer to its inputs and step outputs relative to the
+    workflow ('input', 'step/output'), as a standalone document needs them. The handlers build '#step/output', pack
+    makes every reference absolute instead
+    """
+    def _relative(ref):
+        if isinstance(ref, list):
+            return [_relative(r) for r in ref]
+        return ref[1:] if ref.startswith('#') else ref
+
+    wf = OrderedDict(wf)
+    steps = []
+    for step in wf['steps']:
+        step = OrderedDict(step)
+        if isinstance(step['in'], list):
+            step['in'] = [dict(inp, source=_relative(inp['source'])) if 'source' in inp else inp for inp in step['in']]
+        else:  # {input id: source}, see read_tsv
+            step['in'] = OrderedDict((key, _relative(source)) for key, source in step['in'].items())
+        steps.append(step)
+    wf['steps'] = steps
+    wf['outputs'] = [dict(out, outputSource=_relative(out['outputSource'])) if 'outputSource' in out else out
+                     for out in wf['outputs']]
+    return wf
+
+
+def pack(documents):
+    """
+    Combine (file name, CWL document) pairs into a single packed CWL document. Every document becomes an entry of
+    its $graph with the id '#<file name without .cwl>', which is unique where the document ids are not (an imported
+    task 'lib.t' has the id 't', like a task 't' of the file itself). 'run' references point to those ids and the
+    source references of workflows are made absolute, prefixed with the workflow id
+    """
+    documents = list(documents)
+    ids = dict((filename, filename[:-len('.cwl')] if filename.endswith('.cwl') else filename)
+               for filename, document in documents)
+
+    def _absolute(ref, wf_id):
+        if isinstance(ref, list):
+            return [_absolute(r, wf_id) for r in ref]
+        return '#{0}/{1}'.format(wf_id, ref[1:] if ref.startswith('#') else ref)
+
+    graph = []
+    cwl_version = None
+    namespaces = {}
+    for filename, document in documents:
+        document = OrderedDict(document)
+        cwl_version = document.pop('cwlVersion', cwl_version)
+        namespaces.update(document.pop('$namespaces', {}))
+        document['id'] = '#' + ids[filename]
+        if document.get('class') == 'Workflow':
+            document['steps'] = [OrderedDict(step) for step in document['steps']]
+            for step in document['steps']:
+                step['run'] = '#' + ids.get(step['run'], step['run'])
+                if isinstance(step['in'], list):
+                    step['in'] = [dict(inp, source=_absolute(inp['source'], ids[filename])) if 'source' in inp
+                                  else inp for inp in step['in']]
+                else:
+                    step['in'] = OrderedDict((key, _absolute(source, ids[filename]))
+                                             for key, source in step['in'].items())
+            document['outputs'] = [dict(out, outputSource=_absolute(out['outputSource'], ids[filename]))
+                                   if 'outputSource' in out else out for out in document['outputs']]
+        graph.append(document)
+    packed = OrderedDict([('cwlVersion', cwl_version), ('$graph', graph)])
+    if namespaces:
+        packed['$namespaces'] = namespaces
+    return packed
+
+
+def store_tools(documents, store, conversion):
+    """
+    Redirect the tools among (file name, CWL document) pairs to a ToolStore and point the steps of workflows to the
+    stored copies. Workflows come last, once the stored names of all the tools they run are known
+    """
+    stored = {}
+    workflows = []
+    for filename, document in documents:
+        if document.get('class') == 'Workflow':
+            workflows.append((filename, document))
+            continue
+        tool_id, digest, name = store.name(filename, document)
+        conversion.tools.append((tool_id, digest, name))
+        stored[filename] = os.path.relpath(os.path.join(store.directory, name), conversion.directory)
+        yield os.path.join(store.directory, name), document
+    for filename, document in workflows:
+        steps = [dict(step, run=stored.get(step['run'], step['run'])) for step in document['steps']]
+        yield filename, dict(document, steps=steps)
+
+
+def printstuff(wdl_code, parser, directory=None, quiet=False, cache=None, packed=None, compact=False, store=None,
+               imports=None, source=None, prune=False, cwl_version=DEFAULT_VERSION, read_tsv='expression'):
+    """
+    Convert WDL source code (or its AST) and write every CWL document to its own file in directory, or all of them to
+    a single packed document named `packed`. With a ToolStore, tools are written to the store instead of directory.
+    Imports are resolved relative to `source`, the path of the WDL file, through the ImportGraph of the run. With
+    `prune`, unused outputs, steps and inputs are removed from workflows (see prune.py). Documents are written for
+    `cwl_version` (see versions.py), with `read_tsv` as the lowering of read_tsv ('expression' or 'command')
+    """
+    conversion = Conversion(directory, quiet, imports, source, prune, cwl_version, read_tsv)
+    documents = iter_documents(wdl_code, parser, cache, conversion)
+    if packed:
+        documents = [(packed, pack(documents))]
+    elif store is not None:
+        documents = store_tools(documents, store, conversion)
+    for filename, document in documents:
+        filename, digest = export_tool(document, conversion.directory, quiet, filename=filename, compact=compact)
+        conversion.outputs[filename] = digest
+    return conversion
+
+
+def write_file(filename, data):
+    """
+    Write data to filename unless the file already holds exactly this content, so that unchanged outputs keep their
+    modification time. The data is written to a temporary file that replaces filename, so that readers (and workers
+    writing the same stored tool) never see a partly written file. Returns the sha256 digest of data
+    """
+    with profile.phase('write'):
+        digest = sha256(data)
+        if file_sha256(filename) == digest:
+            logger.info('File {0} is up to date'.format(filename))
+        else:
+            tmp = '{0}.{1}-{2}.tmp'.format(filename, os.getpid(), threading.get_ident())
+            try:
+                with open(tmp, 'w') as f:
+                    f.write(data)
+                os.replace(tmp, filename)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            logger.info('Generated file {0}'.format(filename))
+    return digest
+
+
+def dump_json(document, compact=False):
+    if compact:
+        return json.dumps(document, separators=(',', ':'))
+    return json.dumps(document, indent=4)
+
+
+def render_code(code):
+    """
+    Return the text of a CWL file around the already serialized JSON of a document
+    """
+    with profile.phase('render'):
+        return HEADER.format(__version__) + code
 
-    for expression_tool in expression_tools:
-        export_expression_tool(expression_tool[0], expression_tool[1], directory)
 
-    main_template.render()
+def render_tool(tool, compact=False):
+    """
+    Return the text of a CWL file for the given document
+    """
+    return render_code(dump_json(tool, compact))
 
 
-def export_tool(tool, directory, quiet=False):
+def export_tool(tool, directory, quiet=False, filename=None, compact=False):
+    """
+    Write a CWL document to directory (and print it unless quiet). The document is serialized once, for both
+    """
+    code = dump_json(tool, compact)
     if not quiet:
-        print(json.dumps(tool, indent=4))
-    data = main_template.render(version=__version__,
-                                code=json.dumps(tool, indent=4))
-    filename = '{0}.cwl'.format(tool['id'])
+        print(code)
+    data = render_code(code)
+    filename = filename or '{0}.cwl'.format(tool['id'])
     filename = os.path.join(directory, filename)
-    with open(filename, 'w') as f:
-        f.write(data)
-    logger.info('Generated file {0}'.format(filename))
-
-
-def export_expression_tool(tool, substitutions, directory):
-    replacements = dict([sub for sub in substitutions.values()])
-    pattern = re.compile('|'.join(replacements.keys()))
-    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                           'expression-tools', tool)) as source:
-        with open(os.path.join(directory, tool), 'w') as target:
-            for line in source:
-                target.write(pattern.sub(lambda x: replacements[x.group()], line))
-
-
-def process_file(file, args):
-    with open(file) as f:
-        k = f.read()
-    k.replace('\n', '')
-    if args.directory:
-        args.directory = os.path.abspath(args.directory)
-        if os.path.isdir(args.directory):
-            os.chdir(args.directory)
-        else:
-            os.mkdir(args.directory)
-            os.chdir(args.directory)
-    else:
-        args.directory = os.getcwd()
+    return filename, write_file(filename, data)
+
+
+def load_expression_tool(tool, substitutions):
+    """
+    Load a bundled expression tool, renaming terms in the given top-level fields (e.g. the generic output name
+    'outputArray' to the name of the WDL declaration it is assigned to)
+    """
+    def _substitute(obj, term, sub):
+        if isinstance(obj, dict):
+            return OrderedDict((_substitute(k, term, sub), _substitute(v, term, sub)) for k, v in obj.items())
+        elif isinstance(obj, list):
+            return [_substitute(el, term, sub) for el in obj]
+        elif isinstance(obj, str):
+            return obj.replace(term, sub)
+        return obj
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expression-tools', tool)) as f:
+        document = json.load(f, object_pairs_hook=OrderedDict)
+    for field, (term, sub) in substitutions.items():
+        document[field] = _substitute(document[field], term, sub)
+    return document
+
+
+def output_directory(args):
+    return os.path.abspath(args.directory or os.getcwd())
+
+
+def load_imports(args):
+    """
+    Return a new ImportGraph for a run, parsing through the parse cache if there is one
+    """
+    cache = AstCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    return ImportGraph(lambda code, parser: parse(code, parser, cache), args.parser)
+
+
+def load_manifest(args):
+    """
+    Return the manifest of the previous run in incremental mode, None otherwise
+    """
+    if args.incremental:
+        return Manifest.load(output_directory(args))
+
+
+def output_options(args):
+    """
+    Return the options that change what a WDL file is converted to, {option: value}. They are recorded in the
+    manifest, so that changing one of them converts the files again in incremental mode
+    """
+    return {'no_folder': args.no_folder, 'pack': args.pack, 'compact': args.compact, 'dedup': args.dedup,
+            'prune': args.prune, 'cwl_version': args.cwl_version, 'read_tsv': args.read_tsv}
+
+
+def process_file(file, args, previous=None, imports=None):
+    """
+    Convert a single WDL file and return its manifest entry. In incremental mode the file is not converted again if
+    `previous`, its entry from the last run, shows that neither the source, the files it imports, the converter nor
+    the options changing the output have changed since. Files converted in the same run should share their
+    ImportGraph
+    """
+    if imports is None:
+        imports = load_imports(args)
+    directory = output_directory(args)
+    parser = imports.parser_for(file)
+    source_hash = imports.source_hash(file)
+    import_hashes = imports.import_hashes(file)
+    options = output_options(args)
+    if args.incremental and is_fresh(previous, directory, source_hash, parser.__name__, converter_hash(),
+                                     import_hashes, options):
+        logger.info('Skipping unchanged file {0}'.format(file))
+        return previous
+    if not os.path.isdir(directory):
+        os.mkdir(directory)
+    store = ToolStore(os.path.join(directory, STORE_NAME)) if args.dedup else None
     if not args.no_folder:
-        cwl_directory = os.path.join(args.directory, os.path.basename(os.path.abspath(file)).replace('.wdl', ''))
-        os.mkdir(cwl_directory)
-        printstuff(k, args.parser, cwl_directory, args.quiet)
+        cwl_directory = os.path.join(directory, os.path.basename(os.path.abspath(file)).replace('.wdl', ''))
+        if not os.path.isdir(cwl_directory):
+            os.mkdir(cwl_directory)
     else:
-        printstuff(k, args.parser, directory=args.directory, quiet=args.quiet)
+        cwl_directory = directory
+    packed = os.path.basename(os.path.abspath(file)).replace('.wdl', '') + '.cwl' if args.pack else None
+    with profile.source(file):
+        conversion = printstuff(imports.load(file), parser, cwl_directory, args.quiet, packed=packed,
+                                compact=args.compact, store=store, imports=imports, source=file, prune=args.prune,
+                                cwl_version=args.cwl_version, read_tsv=args.read_tsv)
+    entry = make_entry(directory, source_hash, parser.__name__, converter_hash(), conversion.outputs, import_hashes,
+                       options)
+    if store is not None:
+        entry['tools'] = conversion.tools
+    if args.incremental:
+        # stored tools may be shared with other files, so they are never removed
+        remove_stale_outputs(previous, entry, directory, shared=[STORE_NAME])
+    return entry
+
+
+class _RecordingHandler(logging.Handler):
+    """
+    Collects log messages emitted in a worker process so that they can be replayed by the parent
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.levelno, record.getMessage()))
+
+
+_worker_imports = None  # ImportGraph shared by the files converted in a worker process
+
+
+def _process_file_job(job):
+    """
+    Convert a single file in a worker process. Returns the captured stdout, log messages, error (if any) and
+    profile so that the parent can report them in the same order as a serial run would
+    """
+    global _worker_imports
+    file, args, previous = job
+    if args.parser is not None:
+        args.parser = load_parser(args.parser)
+    if _worker_imports is None:
+        _worker_imports = load_imports(args)
+    handler = _RecordingHandler()
+    handlers, logger.handlers = logger.handlers, [handler]
+    stdout = sys.stdout
+    sys.stdout = buf = StringIO()
+    entry = error = None
+    profiler = profile.Profiler() if args.profile else None
+    try:
+        with profile.activate(profiler):
+            entry = process_file(file, args, previous, _worker_imports)
+    except Exception as e:
+        error = str(e)
+    finally:
+        sys.stdout = stdout
+        logger.handlers = handlers
+    return file, entry, buf.getvalue(), handler.messages, error, profiler and profiler.data()
+
+
+def process_directory(args):
+    imports = load_imports(args)
+    # imported files first, so that their tools are converted before the files that call them
+    files = imports.order([os.path.join(args.workflow, el) for el in os.listdir(args.workflow) if el.endswith('.wdl')])
+    manifest = load_manifest(args)
+    report = StoreReport() if args.dedup else None
+
+    def _previous(file):
+        return manifest.get(file) if manifest else None
+
+    def _record(file, entry):
+        if manifest:
+            manifest.update(file, entry)
+        if report:
+            report.add(file, entry.get('tools', []))
+
+    try:
+        if args.jobs > 1:
+            if args.directory:
+                args.directory = os.path.abspath(args.directory)
+                if not os.path.isdir(args.directory):
+                    os.mkdir(args.directory)
+            import multiprocessing  # only needed for --jobs
+            # parser modules cannot be pickled, so workers import them by name
+            job_args = argparse.Namespace(**vars(args))
+            if args.parser is not None:
+                job_args.parser = parser_name(args.parser)
+            pool = multiprocessing.Pool(args.jobs)
+            try:
+                results = pool.imap(_process_file_job, [(file, job_args, _previous(file)) for file in files])
+                for file, entry, output, messages, error, profile_data in results:
+                    sys.stdout.write(output)
+                    if profile_data:
+                        profile.current().merge(profile_data)
+                    for level, message in messages:
+                        logger.log(level, message)
+                    if error is not None:
+                        logger.error("Error while processing file {0}: {1}".format(os.path.basename(file), error))
+                    else:
+                        _record(file, entry)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for file in files:
+                try:
+                    entry = process_file(file, args, _previous(file), imports)
+                except Exception as e:
+                    logger.error("Error while processing file {0}: {1}".format(os.path.basename(file), e))
+                else:
+                    _record(file, entry)
+    finally:
+        if manifest:
+            manifest.save()
+    if report:
+        report.log()
+        report.write(os.path.join(output_directory(args), STORE_NAME, 'report.json'))
 
 
 def main():
     parser = argparse.ArgumentParser(description='Convert a WDL workflow to CWL')
     parser.add_argument('workflow', help='a WDL workflow or a directory with WDL files')
-    parser.add_argument('--parser', choices=wdl_parser.parsers.values(), type=lambda key: wdl_parser.parsers[key],
-                        help='WDL version to use for parsing')
+    parser.add_argument('--parser', choices=PARSERS,
+                        help='WDL version to use for parsing, detected from the version statement of every file by '
+                             'default')
     parser.add_argument('-d', '--directory', help='Directory to store CWL files')
     parser.add_argument('-q', '--quiet', action='store_true', help='Do not print generated files to stdout')
     parser.add_argument('--no-folder', action='store_true', help='Do not create a separate folder for each toolset')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes to use when converting a directory')
+    parser.add_argument('--cache-dir', help='Directory to cache parsed WDL files in, so that unchanged files are not '
+                                            'parsed again')
+    parser.add_argument('--cache-size', type=int, default=512,
+                        help='Maximum size of the parse cache in MiB (least recently used entries are evicted first)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only convert WDL files that changed since the last run into the same directory')
+    parser.add_argument('--pack', action='store_true',
+                        help='Write all documents converted from a WDL file into one packed CWL file ($graph)')
+    parser.add_argument('--compact', action='store_true', help='Write JSON without indentation')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Write every distinct tool of a batch once to a shared "{0}" folder, which workflows '
+                             'refer to'.format(STORE_NAME))
+    parser.add_argument('--cwl-version', choices=VERSIONS, default=DEFAULT_VERSION,
+                        help='CWL version to write. From v1.1 on, tools turn off directory listing and allow network '
+                             'access, and the runtime attributes needing v1.1 are converted')
+    parser.add_argument('--read-tsv', choices=['expression', 'command'], default='expression',
+                        help='Run read_tsv() as a JavaScript expression tool (limited to 64 KiB files) or as a command '
+                             'line tool streaming the file (needs python3)')
+    parser.add_argument('--prune', action='store_true',
+                        help='Remove the steps no workflow output depends on and, without a WDL output section, only '
+                             'export the call outputs that no other step consumes')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in every handler and source file to stderr')
+    parser.add_argument('--profile-output', help='File to write the profile to')
+    parser.add_argument('--profile-format', choices=['json', 'collapsed'], default='json',
+                        help='Format of --profile-output: JSON, or collapsed stacks for flamegraph.pl')
     args = parser.parse_args()
+    if args.dedup and args.pack:
+        parser.error('--dedup cannot be combined with --pack')
+    if ch not in logger.handlers:
+        logger.addHandler(ch)
+    if args.parser is not None:
+        args.parser = load_parser(args.parser)
     args.workflow = os.path.abspath(args.workflow)
-    if os.path.isdir(args.workflow):
-        for el in os.listdir(args.workflow):
-            if el.endswith('.wdl'):
-                try:
-                    process_file(os.path.join(args.workflow, el), args)
-                except Exception as e:
-                    logger.error("Error while processing file {0}: {1}".format(el, e))
-                    pass
-    else:
-        process_file(args.workflow, args)
+    args.profile = args.profile or bool(args.profile_output)
+    profiler = profile.Profiler() if args.profile else None
+    with profile.activate(profiler):
+        if os.path.isdir(args.workflow):
+            process_directory(args)
+        else:
+            manifest = load_manifest(args)
+            try:
+                entry = process_file(args.workflow, args, manifest.get(args.workflow) if manifest else None)
+            except VersionError as e:
+                parser.error(str(e))
+            if manifest:
+                manifest.update(args.workflow, entry)
+                manifest.save()
+    if profiler:
+        print(profiler.summary(), file=sys.stderr)
+        if args.profile_output:
+            profiler.write(args.profile_output, args.profile_format)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,136 @@
+"""
+Manifest of an incremental conversion.
+
+For every converted WDL file the manifest records the hash of its source, the parser used, the hash of the
+converter's own source files (see converter_hash), the command line options that change the output, and the hashes
+of the CWL files it produced. A file whose entry still
+matches can be skipped on the next run.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_NAME = '.wdl2cwl-manifest.json'
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_converter_hash = None
+
+
+def sha256(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    try:
+        with open(path, 'rb') as f:
+            return sha256(f.read())
+    except (IOError, OSError):
+        return None
+
+
+def converter_hash():
+    """
+    Hash of the files of the wdl2cwl package (modules and expression tool templates). Any change to the converter
+    changes it, so outputs of an older converter are never taken as fresh, whether or not __version__ was bumped
+    """
+    global _converter_hash
+    if _converter_hash is None:
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(PACKAGE_DIRECTORY):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, PACKAGE_DIRECTORY).encode('utf-8'))
+                digest.update(file_sha256(path).encode('utf-8'))
+        _converter_hash = digest.hexdigest()
+    return _converter_hash
+
+
+class Manifest(object):
+    """
+    Entries are keyed by the absolute path of the WDL file. Output paths are stored relative to the manifest directory
+    """
+    def __init__(self, directory, entries=None):
+        self.directory = os.path.abspath(directory)
+        self.entries = entries or {}
+        self.changed = False
+
+    @classmethod
+    def load(cls, directory):
+        path = os.path.join(directory, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                return cls(directory, json.load(f)['files'])
+        except (IOError, OSError, ValueError, KeyError):
+            return cls(directory)
+
+    def save(self):
+        if not self.changed:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.directory, MANIFEST_NAME))
+        self.changed = False
+
+    def get(self, file):
+        return self.entries.get(os.path.abspath(file))
+
+    def update(self, file, entry):
+        file = os.path.abspath(file)
+        if entry is not None and self.entries.get(file) != entry:
+            self.entries[file] = entry
+            self.changed = True
+
+
+def make_entry(directory, source_hash, parser_name, version, outputs, imports=None, options=None):
+    """
+    Build a manifest entry. `version` identifies the converter (see converter_hash), `outputs` maps absolute output
+    paths to the hashes of their content, `imports` the absolute paths of the files the source imports (directly or
+    not) to the hashes of their content and `options` the names of the options the output depends on to their values
+    """
+    entry = {'source': source_hash,
+             'parser': parser_name,
+             'version': version,
+             'outputs': dict((os.path.relpath(path, directory), digest) for path, digest in outputs.items())}
+    if imports:
+        entry['imports'] = imports
+    if options:
+        entry['options'] = options
+    return entry
+
+
+def is_fresh(entry, directory, source_hash, parser_name, version, imports=None, options=None):
+    """
+    Whether the outputs recorded in entry are still valid: the source, the files it imports, the parser, the converter
+    and the options did not change and every output is still on disk with the recorded content
+    """
+    if not entry or (entry['source'], entry['parser'], entry['version']) != (source_hash, parser_name, version):
+        return False
+    if entry.get('imports', {}) != (imports or {}) or entry.get('options', {}) != (options or {}):
+        return False
+    for path, digest in entry['outputs'].items():
+        if file_sha256(os.path.join(directory, path)) != digest:
+            return False
+    return True
+
+
+def remove_stale_outputs(previous, entry, directory, shared=()):
+    """
+    Delete files that were produced for the previous version of a WDL file but are not produced any more, except for
+    files in the `shared` subdirectories
+    """
+    if not previous:
+        return
+    for path in set(previous['outputs']) - set(entry['outputs']):
+        if path.split(os.sep)[0] in shared:
+            continue
+        try:
+            os.remove(os.path.join(directory, path))
+        except OSError:
+            pass
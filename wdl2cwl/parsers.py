@@ -0,0 +1,109 @@
+"""
+Lazy loading of the WDL grammars of wdl_parser, and detection of the grammar of a file.
+
+Importing the wdl_parser package imports all of its grammar modules, while a conversion needs only the one of its
+files. load_parser imports the module of a single grammar from the package directory without running the package
+__init__. The module is registered under its usual name, so it is the same object as wdl_parser.parsers[name] if
+the package is imported later.
+
+detect_version picks the grammar of WDL source code without parsing it: the `version` statement that starts every
+document since draft-3, or draft-2 for documents without one. Documents whose version cannot be told for sure (a
+misplaced `version` statement, or WDL 1.0 syntax without a version statement) are reported instead of guessed.
+"""
+import importlib.util
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# {name given to --parser: module of wdl_parser}, as in wdl_parser.parsers
+PARSERS = OrderedDict([('1.0', 'version_1_0'),
+                       ('development', 'development'),
+                       ('draft-2', 'draft_2'),
+                       ('draft-3', 'draft_3')])
+
+# {value of the version statement: name of the grammar}
+VERSION_STATEMENTS = {'draft-3': 'draft-3', '1.0': '1.0', 'development': 'development'}
+UNVERSIONED = 'draft-2'
+
+# first line that is not blank or a comment, lines may end with \r\n
+STATEMENT_RE = re.compile(r'^[ \t]*([^#\s].*?)[ \t\r]*$', re.MULTILINE)
+VERSION_RE = re.compile(r'^version[ \t]+([^\s#]+)[ \t\r]*(#.*)?$', re.MULTILINE)
+BOM = '\ufeff'  # byte order mark some editors write at the start of UTF-8 files
+# syntax that WDL 1.0 introduced, and that a document without a version statement cannot use
+NEWER_SYNTAX = [(re.compile(r'^[ \t]*input[ \t]*\{', re.MULTILINE), 'an input section'),
+                (re.compile(r'^[ \t]*struct[ \t]+\w+[ \t]*\{', re.MULTILINE), 'a struct')]
+
+_lock = threading.Lock()
+
+
+class VersionError(ValueError):
+    """
+    The WDL version of a document cannot be detected
+    """
+
+
+def load_parser(name):
+    """
+    Return the parser module of a WDL version, importing only that module
+    """
+    if name not in PARSERS:
+        raise ValueError('Unknown WDL parser {0}, expected one of {1}'.format(name, ', '.join(PARSERS)))
+    module_name = 'wdl_parser.' + PARSERS[name]
+    with _lock:
+        module = sys.modules.get(module_name)
+        if module is None:
+            package = importlib.util.find_spec('wdl_parser')
+            if package is None:
+                raise ImportError('wdl_parser is not installed')
+            path = os.path.join(package.submodule_search_locations[0], PARSERS[name] + '.py')
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[module_name]
+                raise
+    return module
+
+
+def parser_name(module):
+    """
+    Return the name of the WDL version of a parser module (the inverse of load_parser)
+    """
+    return dict((value, key) for key, value in PARSERS.items())[module.__name__.rsplit('.', 1)[-1]]
+
+
+def _line(code, position):
+    return code.count('\n', 0, position) + 1
+
+
+def detect_version(code, source=None):
+    """
+    Return the name of the grammar (a key of PARSERS) of WDL source code from a lexical scan. Raises VersionError if the
+    version cannot be detected for sure. `source` names the code in error messages
+    """
+    source = source or 'WDL source'
+    if code.startswith(BOM):
+        code = code[len(BOM):]
+    first = STATEMENT_RE.search(code)
+    match = VERSION_RE.match(first.group(1)) if first else None
+    if match:
+        version = match.group(1)
+        if version not in VERSION_STATEMENTS:
+            raise VersionError('{0}: WDL version {1} is not supported, the parsers know {2}'.format(
+                source, version, ', '.join(sorted(VERSION_STATEMENTS))))
+        return VERSION_STATEMENTS[version]
+    misplaced = VERSION_RE.search(code)
+    if misplaced:
+        raise VersionError('{0}: the version statement on line {1} must come before anything else, choose the grammar '
+                           'with --parser'.format(source, _line(code, misplaced.start())))
+    for pattern, description in NEWER_SYNTAX:
+        match = pattern.search(code)
+        if match:
+            raise VersionError('{0}: no version statement (WDL draft-2), but line {1} has {2} (WDL 1.0); add a version '
+                               'statement or choose the grammar with --parser'.format(
+                                   source, _line(code, match.start()), description))
+    return UNVERSIONED
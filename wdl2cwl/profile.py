@@ -0,0 +1,166 @@
+"""
+Opt-in instrumentation of the conversion (--profile).
+
+While a Profiler is active in the current thread, ihandle reports every handler call to it and the parse, render and
+write steps are timed as phases. The profiler keeps call counts, cumulative and self time per handler, per source file
+and per call stack, and can be written as a summary table, as JSON or as collapsed stacks for flamegraph.pl.
+"""
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def current():
+    """
+    Return the profiler active in this thread, if any
+    """
+    return getattr(_local, 'profiler', None)
+
+
+@contextmanager
+def activate(profiler):
+    previous = current()
+    _local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = previous
+
+
+class _NullContext(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_context = _NullContext()
+
+
+def phase(name):
+    """
+    Time a non-handler step (e.g. 'parse') with the active profiler, if any
+    """
+    profiler = current()
+    if profiler is None:
+        return _null_context
+    return profiler.frame('[{0}]'.format(name))
+
+
+def source(file):
+    """
+    Attribute everything measured within the block to the given source file
+    """
+    profiler = current()
+    if profiler is None:
+        return _null_context
+    return profiler.source(file)
+
+
+def _add(stats, name, count, cumulative, own):
+    entry = stats.setdefault(name, [0, 0.0, 0.0])
+    entry[0] += count
+    entry[1] += cumulative
+    entry[2] += own
+
+
+class Profiler(object):
+
+    def __init__(self):
+        self.file = None
+        self.handlers = {}  # {name: [calls, cumulative time, self time]}
+        self.files = {}  # {file: {name: [calls, cumulative time, self time]}}
+        self.stacks = {}  # {'file;Name;Name': self time}
+        self._stack = []  # [[name, start, time spent in nested frames]]
+        self._active = {}  # {name: number of frames of that name on the stack}, so that recursion is counted once
+
+    @contextmanager
+    def source(self, file):
+        previous, self.file = self.file, file
+        try:
+            yield
+        finally:
+            self.file = previous
+
+    @contextmanager
+    def frame(self, name):
+        self._push(name)
+        try:
+            yield
+        finally:
+            self._pop()
+
+    def call(self, name, func, *args, **kwargs):
+        """
+        Call a handler, recording it under the given name
+        """
+        self._push(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._pop()
+
+    def _push(self, name):
+        self._stack.append([name, timer(), 0.0])
+        self._active[name] = self._active.get(name, 0) + 1
+
+    def _pop(self):
+        name, start, nested = self._stack.pop()
+        elapsed = timer() - start
+        self._active[name] -= 1
+        cumulative = elapsed if not self._active[name] else 0.0
+        own = elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        file = self.file or '<unknown>'
+        _add(self.handlers, name, 1, cumulative, own)
+        _add(self.files.setdefault(file, {}), name, 1, cumulative, own)
+        stack = ';'.join([os.path.basename(file)] + [frame[0] for frame in self._stack] + [name])
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+
+    def data(self):
+        return {'handlers': self.handlers, 'files': self.files, 'stacks': self.stacks}
+
+    def merge(self, data):
+        """
+        Add the data of another profiler (e.g. of a worker process)
+        """
+        for name, values in data['handlers'].items():
+            _add(self.handlers, name, *values)
+        for file, stats in data['files'].items():
+            for name, values in stats.items():
+                _add(self.files.setdefault(file, {}), name, *values)
+        for stack, own in data['stacks'].items():
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+
+    def summary(self, limit=30):
+        """
+        Return a table of the handlers with the highest self time, followed by the total time per source file
+        """
+        lines = ['{0:<28} {1:>9} {2:>12} {3:>12}'.format('handler', 'calls', 'cumulative', 'self')]
+        rows = sorted(self.handlers.items(), key=lambda item: item[1][2], reverse=True)
+        for name, (calls, cumulative, own) in rows[:limit]:
+            lines.append('{0:<28} {1:>9} {2:>12.6f} {3:>12.6f}'.format(name, calls, cumulative, own))
+        lines.append('')
+        lines.append('{0:<54} {1:>12}'.format('file', 'time'))
+        totals = [(file, sum(values[2] for values in stats.values())) for file, stats in self.files.items()]
+        for file, total in sorted(totals, key=lambda item: item[1], reverse=True)[:limit]:
+            lines.append('{0:<54} {1:>12.6f}'.format(os.path.basename(file), total))
+        return '\n'.join(lines)
+
+    def write(self, filename, format='json'):
+        with open(filename, 'w') as f:
+            if format == 'collapsed':
+                for stack, own in sorted(self.stacks.items()):
+                    f.write('{0} {1}\n'.format(stack, int(round(own * 1e6))))
+            else:
+                json.dump(self.data(), f, indent=2, sort_keys=True)
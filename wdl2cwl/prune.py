@@ -0,0 +1,191 @@
+"""
+Elimination of the dead parts of converted workflows (--prune).
+
+Without a WDL output section, every output of every call becomes a workflow output, so runners keep and stage every
+intermediate file. The pass builds the dependency graph of the steps of a workflow from the sources of the step inputs
+and of the workflow outputs, then
+- only exports the outputs that no step consumes, if the outputs were not given in WDL,
+- removes the steps that no workflow output depends on, directly or not,
+- removes the workflow inputs that only the removed steps used.
+Scatter subworkflows are pruned in the same way, keeping only the outputs that the enclosing workflow uses. Everything
+that is removed is logged and recorded in a list of (workflow id, kind, id).
+"""
+import logging
+import re
+
+logger = logging.getLogger('Main')
+
+REFERENCE_RE = re.compile(r'^#?([A-Za-z0-9_.-]+)(?:/([A-Za-z0-9_.-]+))?$')
+
+
+def step_sources(step):
+    """
+    Return the sources of the inputs of a step ('in' is a list of inputs, or {input id: source} for read_tsv steps)
+    """
+    if isinstance(step['in'], dict):
+        values = list(step['in'].values())
+    else:
+        values = [inp['source'] for inp in step['in'] if 'source' in inp]
+    result = []
+    for value in values:
+        result.extend(value if isinstance(value, list) else [value])
+    return result
+
+
+class StepGraph(object):
+    """
+    Dependencies between the steps of a workflow, and which step outputs and workflow inputs are used
+    """
+    def __init__(self, wf):
+        self.steps = dict((step['id'], step) for step in wf['steps'])
+        self.depends = {}  # {step id: set of the ids of the steps it takes inputs from}
+        self.consumed = set()  # {(step id, output id)} used by steps
+        self.exported = set()  # {(step id, output id)} used by workflow outputs (or expressions)
+        self.inputs = set()  # ids of the workflow inputs used by steps or outputs
+        self.opaque = []  # sources that do not refer to a step output or to an input
+        for step in wf['steps']:
+            self.depends[step['id']] = set()
+            for source in step_sources(step):
+                output = self.reference(source)
+                if output is not None:
+                    self.depends[step['id']].add(output[0])
+                    self.consumed.add(output)
+        # steps listing their outputs as plain names (read_tsv) can be referred to in expressions, e.g. defaults
+        expressions = [inp['default'] for inp in wf['inputs'] if isinstance(inp.get('default'), str)]
+        expressions.extend(inp['valueFrom'] for step in wf['steps'] if isinstance(step['in'], list)
+                           for inp in step['in'] if 'valueFrom' in inp)
+        for step in wf['steps']:
+            for out in step['out']:
+                if not isinstance(out, dict) and any(re.search(r'\b{0}\b'.format(re.escape(out)), expression)
+                                                     for expression in expressions):
+                    self.exported.add((step['id'], out))
+        for out in wf['outputs']:
+            if 'outputSource' in out:
+                for source in out['outputSource'] if isinstance(out['outputSource'], list) else [out['outputSource']]:
+                    output = self.reference(source)
+                    if output is not None:
+                        self.exported.add(output)
+
+    def reference(self, source):
+        """
+        Return (step id, output id) for a reference to a step output. References to inputs are recorded and give None
+        """
+        match = REFERENCE_RE.match(source)
+        if match is None or (match.group(2) and match.group(1) not in self.steps):
+            self.opaque.append(source)
+            return None
+        if not match.group(2):
+            self.inputs.add(match.group(1))
+            return None
+        return match.groups()
+
+    def live(self):
+        """
+        Return the ids of the steps that the workflow outputs depend on
+        """
+        live = set()
+        stack = [step_id for step_id, output in self.exported]
+        while stack:
+            step_id = stack.pop()
+            if step_id not in live:
+                live.add(step_id)
+                stack.extend(self.depends[step_id])
+        return live
+
+    def used_outputs(self, step_id):
+        return set(output for sid, output in self.consumed | self.exported if sid == step_id)
+
+
+def _drop_requirement(wf, requirement, needed):
+    if not needed:
+        wf['requirements'] = [r for r in wf['requirements'] if r.get('class') != requirement]
+
+
+def _forget(run, subworkflows):
+    """
+    Remove a subworkflow that is no longer run, and the subworkflows it runs
+    """
+    subwf = subworkflows.pop(run, None)
+    if subwf is not None:
+        for step in subwf['steps']:
+            _forget(step['run'], subworkflows)
+
+
+def _consumed(graph, output, subworkflows):
+    """
+    Whether a step output (step id, output id) is consumed by another step, possibly inside the subworkflow that
+    produces it
+    """
+    if output is None or output in graph.consumed:
+        return output is not None
+    subwf = subworkflows.get(graph.steps[output[0]]['run'])
+    if subwf is not None:
+        inner = StepGraph(subwf)
+        for out in subwf['outputs']:
+            if out['id'] == output[1] and 'outputSource' in out:
+                return _consumed(inner, inner.reference(out['outputSource']), subworkflows)
+    return False
+
+
+def prune_workflow(wf, subworkflows, export_all, report, keep=()):
+    """
+    Prune a workflow in place. `subworkflows` maps the file names of the subworkflows its steps run to the documents,
+    which are pruned too (subworkflows that are no longer run are removed from it). With `export_all`, the outputs of
+    the workflow are all the outputs of its calls and only the outputs no step consumes are kept. The inputs in `keep`
+    are never removed. Removals are appended to `report` as (workflow id, kind, id). Returns the ids of the removed
+    inputs
+    """
+    graph = StepGraph(wf)
+    if graph.opaque:
+        logger.warning('{0}: not pruned, unknown sources: {1}'.format(wf['id'], ', '.join(graph.opaque)))
+        return []
+    used_inputs = graph.inputs
+
+    if export_all:
+        outputs = []
+        for out in wf['outputs']:
+            if _consumed(graph, graph.reference(out['outputSource']), subworkflows):
+                report.append((wf['id'], 'output', out['id']))
+                logger.info('{0}: output {1} is not exported, other steps consume it'.format(wf['id'], out['id']))
+            else:
+                outputs.append(out)
+        wf['outputs'] = outputs
+        graph = StepGraph(wf)
+
+    live = graph.live()
+    steps = []
+    for step in wf['steps']:
+        if step['id'] in live:
+            steps.append(step)
+        else:
+            report.append((wf['id'], 'step', step['id']))
+            logger.warning('{0}: step {1} is removed, no workflow output depends on it'.format(wf['id'], step['id']))
+            _forget(step['run'], subworkflows)
+    if len(steps) < len(wf['steps']):
+        wf['steps'] = steps
+        graph = StepGraph(wf)
+
+    for step in wf['steps']:
+        subwf = subworkflows.get(step['run'])
+        if subwf is not None:
+            used = graph.used_outputs(step['id'])
+            step['out'] = [out for out in step['out'] if out['id'] in used]
+            subwf['outputs'] = [out for out in subwf['outputs'] if out['id'] in used]
+            removed = prune_workflow(subwf, subworkflows, False, report, keep=step.get('scatter', []))
+            step['in'] = [inp for inp in step['in'] if inp['id'] not in removed]
+    graph = StepGraph(wf)
+
+    removed = [inp['id'] for inp in wf['inputs']
+               if inp['id'] in used_inputs and inp['id'] not in graph.inputs and inp['id'] not in keep]
+    if removed:
+        wf['inputs'] = [inp for inp in wf['inputs'] if inp['id'] not in removed]
+        for input_id in removed:
+            report.append((wf['id'], 'input', input_id))
+            logger.info('{0}: input {1} is removed, only removed steps used it'.format(wf['id'], input_id))
+
+    _drop_requirement(wf, 'ScatterFeatureRequirement', any('scatter' in step for step in wf['steps']))
+    _drop_requirement(wf, 'SubworkflowFeatureRequirement', any(step['run'] in subworkflows for step in wf['steps']))
+    _drop_requirement(wf, 'StepInputExpressionRequirement',
+                      any('valueFrom' in inp for step in wf['steps'] if isinstance(step['in'], list)
+                          for inp in step['in']))
+    return removed
@@ -0,0 +1,43 @@
+"""
+Requirements of CWL documents that depend on their content.
+
+A document only lists InlineJavascriptRequirement if one of its expressions needs JavaScript, see uses_javascript.
+"""
+import re
+
+# CWL parameter reference, e.g. $(inputs.reads[0].path): evaluated by the runner without a JavaScript engine
+PARAMETER_REFERENCE = re.compile(r"\$\([A-Za-z0-9_]+(?:\.[A-Za-z0-9_]+|\['(?:[^'\\]|\\.)*'\]|"
+                                 r"\[\"(?:[^\"\\]|\\.)*\"\]|\[[0-9]+\])*\)")
+# fields whose values are never evaluated as expressions
+NOT_EVALUATED = {'id', 'class', 'cwlVersion', 'type', 'default', 'doc', 'label', 'run', 'source', 'outputSource'}
+
+
+def uses_javascript(value):
+    """
+    Whether any expression in a CWL document (or a part of one) needs JavaScript, i.e. is not a plain parameter
+    reference
+    """
+    if isinstance(value, dict):
+        return any(uses_javascript(v) for k, v in value.items() if k not in NOT_EVALUATED)
+    if isinstance(value, list):
+        return any(uses_javascript(v) for v in value)
+    if isinstance(value, str):
+        value = PARAMETER_REFERENCE.sub('', value)
+        return '$(' in value or '${' in value
+    return False
+
+
+def set_requirement(document, requirement, needed, position=None):
+    """
+    List the requirement class once in the document's requirements if needed, and not at all otherwise. A requirement
+    that is already listed keeps its place, a new one is inserted at position (appended by default)
+    """
+    requirements = document['requirements']
+    indices = [i for i, r in enumerate(requirements) if r['class'] == requirement]
+    if indices:
+        position = indices[0]
+    elif position is None:
+        position = len(requirements)
+    requirements[:] = [r for r in requirements if r['class'] != requirement]
+    if needed:
+        requirements.insert(position, {'class': requirement})
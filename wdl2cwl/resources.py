@@ -0,0 +1,95 @@
+"""
+Conversion of the sizes of the WDL runtime section to the units of CWL's ResourceRequirement.
+
+WDL sizes are strings such as "3500 MB" or "2 GiB" (decimal and binary units), memory may also be given as a number
+of bytes and disks as "local-disk 100 HDD" (in GiB). CWL wants whole mebibytes. Literal values are converted here;
+for values only known at run time, js_mebibytes and js_local_disk_mebibytes return a JavaScript expression doing the
+same conversion.
+"""
+import math
+import re
+
+MEBIBYTE = 1024 ** 2
+
+UNITS = {'B': 1,
+         'K': 1000, 'KB': 1000,
+         'M': 1000 ** 2, 'MB': 1000 ** 2,
+         'G': 1000 ** 3, 'GB': 1000 ** 3,
+         'T': 1000 ** 4, 'TB': 1000 ** 4,
+         'KI': 1024, 'KIB': 1024,
+         'MI': 1024 ** 2, 'MIB': 1024 ** 2,
+         'GI': 1024 ** 3, 'GIB': 1024 ** 3,
+         'TI': 1024 ** 4, 'TIB': 1024 ** 4}
+
+DISK_TYPES = {'HDD', 'SSD', 'LOCAL'}
+
+SIZE_RE = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([A-Za-z]*)\s*$')
+
+
+def parse_size(size, default_unit='B'):
+    """
+    Return the number of bytes of a WDL size, e.g. "3500 MB", "2GiB" or 1024. Numbers without a unit are in
+    default_unit
+    """
+    match = SIZE_RE.match(str(size))
+    if not match or (match.group(2) or default_unit).upper() not in UNITS:
+        raise ValueError('Invalid size: {0}'.format(size))
+    number, unit = match.groups()
+    return float(number) * UNITS[(unit or default_unit).upper()]
+
+
+def parse_disks(disks):
+    """
+    Return the bytes of the local disk and of the other mounted disks of a WDL disks string, a comma separated list of
+    "[mount point] size [unit] [disk type]", e.g. "local-disk 100 HDD, /mnt/ref 20 SSD". Sizes are in GiB by default
+    """
+    local = other = 0
+    for disk in disks.split(','):
+        tokens = disk.split()
+        mount = None
+        if tokens and not re.match(r'[0-9.]', tokens[0]):
+            mount = tokens.pop(0)
+        if tokens and tokens[-1].upper() in DISK_TYPES:
+            tokens.pop()
+        size = parse_size(' '.join(tokens), default_unit='GiB')
+        if mount in (None, 'local-disk'):
+            local += size
+        else:
+            other += size
+    return local, other
+
+
+def mebibytes(size):
+    """
+    Round a number of bytes up to whole mebibytes
+    """
+    return int(math.ceil(size / MEBIBYTE))
+
+
+# JavaScript counterpart of parse_size: size(value, default unit) -> bytes
+_JS_SIZE = ("var units = {{{0}}}; "
+            "var size = function(value, unit) {{ "
+            "var match = String(value).trim().match(/^([0-9]*\\.?[0-9]+)\\s*([A-Za-z]*)$/); "
+            "return parseFloat(match[1]) * units[(match[2] || unit).toUpperCase()]; }}; ").format(
+    ', '.join('{0}: {1}'.format(unit, factor) for unit, factor in sorted(UNITS.items())))
+
+
+def js_mebibytes(expression, default_unit='B'):
+    """
+    Return a CWL expression converting the WDL size computed by a JavaScript expression to mebibytes
+    """
+    return "${{{0}return Math.ceil(size({1}, '{2}') / {3}); }}".format(_JS_SIZE, expression, default_unit, MEBIBYTE)
+
+
+def js_local_disk_mebibytes(expression):
+    """
+    Return a CWL expression computing the mebibytes of the local disk of a WDL disks string computed by a JavaScript
+    expression
+    """
+    return ("${{{0}var local = 0; "
+            "String({1}).split(',').forEach(function(disk) {{ "
+            "var tokens = disk.trim().split(/\\s+/); "
+            "var mount = /^[0-9.]/.test(tokens[0]) ? 'local-disk' : tokens.shift(); "
+            "if (['HDD', 'SSD', 'LOCAL'].indexOf(tokens[tokens.length - 1].toUpperCase()) >= 0) {{ tokens.pop(); }} "
+            "if (mount == 'local-disk') {{ local += size(tokens.join(' '), 'GiB'); }} }}); "
+            "return Math.ceil(local / {2}); }}").format(_JS_SIZE, expression, MEBIBYTE)
@@ -0,0 +1,175 @@
+"""
+Long-lived conversion server and its client.
+
+The server keeps the WDL parsers and the handler table loaded and converts WDL sent to it
+over a JSON protocol on localhost:
+
+    POST /convert  {"wdl": "<source>", "parser": "draft-2", "render": true}
+    200            {"documents": [["<file name>", {...}], ...], "files": [["<file name>", "<text>"], ...]}
+    4xx/5xx        {"error": "<message>"}
+
+Without "parser", the version of the source is detected (see parsers.detect_version). "files" (the documents as they
+would be written to disk) is only included when "render" is true. The client only uses the standard library, so a
+conversion does not pay for importing the converter and the parsers.
+"""
+from __future__ import print_function
+
+import argparse
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sys
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+logger = logging.getLogger('Main')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+
+
+class ConversionServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache=None):
+        HTTPServer.__init__(self, address, ConversionRequestHandler)
+        self.cache = cache
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        from wdl2cwl import main
+        from wdl2cwl.parsers import load_parser
+
+        if self.path != '/convert':
+            return self.reply(404, {'error': 'Unknown path {0}'.format(self.path)})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+            parser = load_parser(request['parser']) if request.get('parser') else None
+            wdl = request['wdl']
+        except (ValueError, KeyError, TypeError) as e:
+            return self.reply(400, {'error': 'Malformed request: {0}'.format(e)})
+        try:
+            documents = list(main.iter_documents(wdl, parser, self.server.cache))
+        except Exception as e:
+            return self.reply(422, {'error': '{0}: {1}'.format(e.__class__.__name__, e)})
+        response = {'documents': documents}
+        if request.get('render'):
+            response['files'] = [(filename, main.render_tool(document)) for filename, document in documents]
+        self.reply(200, response)
+
+    def reply(self, status, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def is_loopback(host):
+    """
+    Whether every address a host name resolves to is a loopback address. The server has no authentication, so it must
+    not be reachable from other machines
+    """
+    try:
+        addresses = set(info[4][0] for info in socket.getaddrinfo(host, None))
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, cache=None):
+    server = ConversionServer((host, port), cache)
+    logger.info('Serving conversions on http://{0}:{1}/convert'.format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def request_conversion(url, wdl, parser, render=False):
+    """
+    Send WDL source code to a running server and return its decoded JSON response
+    """
+    body = json.dumps({'wdl': wdl, 'parser': parser, 'render': render}).encode('utf-8')
+    request = Request(url, body, {'Content-Type': 'application/json'})
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        response = e
+    return json.loads(response.read().decode('utf-8'))
+
+
+def server_main():
+    from wdl2cwl import main  # noqa: F401 -- load the handlers and the parsers before serving
+    from wdl2cwl.cache import AstCache
+    from wdl2cwl.parsers import PARSERS, load_parser
+
+    for name in PARSERS:
+        load_parser(name)
+
+    parser = argparse.ArgumentParser(description='Serve WDL to CWL conversions on localhost')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Loopback address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--cache-dir', help='Directory to cache parsed WDL files in')
+    parser.add_argument('--cache-size', type=int, default=512, help='Maximum size of the parse cache in MiB')
+    args = parser.parse_args()
+    if not is_loopback(args.host):
+        parser.error('--host {0} is not a loopback address, the server has no authentication'.format(args.host))
+    cache = AstCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    serve(args.host, args.port, cache)
+
+
+def client_main():
+    parser = argparse.ArgumentParser(description='Convert WDL files to CWL with a running wdl2cwl-server')
+    parser.add_argument('workflows', nargs='+', help='WDL files to convert')
+    parser.add_argument('--parser', help='WDL version to use for parsing, detected from the version statement of '
+                                          'every file by default')
+    parser.add_argument('--url', default='http://{0}:{1}/convert'.format(DEFAULT_HOST, DEFAULT_PORT),
+                        help='URL of the conversion server')
+    parser.add_argument('-d', '--directory', help='Directory to store CWL files')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Do not print generated files to stdout')
+    parser.add_argument('--no-folder', action='store_true', help='Do not create a separate folder for each toolset')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    directory = os.path.abspath(args.directory or os.getcwd())
+    failed = False
+    for workflow in args.workflows:
+        with open(workflow) as f:
+            wdl = f.read()
+        try:
+            response = request_conversion(args.url, wdl, args.parser, render=True)
+        except URLError as e:
+            logger.error('Cannot reach the conversion server at {0}: {1}'.format(args.url, e.reason))
+            sys.exit(1)
+        if 'error' in response:
+            logger.error('Error while processing file {0}: {1}'.format(os.path.basename(workflow), response['error']))
+            failed = True
+            continue
+        target = directory
+        if not args.no_folder:
+            target = os.path.join(directory, os.path.basename(os.path.abspath(workflow)).replace('.wdl', ''))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for filename, document in response['documents']:
+            if not args.quiet:
+                print(json.dumps(document, indent=4))
+        for filename, data in response['files']:
+            with open(os.path.join(target, filename), 'w') as f:
+                f.write(data)
+            logger.info('Generated file {0}'.format(os.path.join(target, filename)))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,80 @@
+"""
+Content-addressed store of converted tools (--dedup).
+
+Every tool is hashed in canonical form (JSON with sorted keys and no whitespace) and written once to the store
+directory as '<id>-<hash>.cwl', no matter how many WDL files of a batch define it. Workflows refer to the stored copy.
+Because the file name only depends on the content, workers converting in parallel never need to coordinate: they
+either write a different file or exactly the same bytes. Files are written under a temporary name and then renamed
+(see main.write_file), so a worker never reads a stored tool that another one is still writing.
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger('Main')
+
+STORE_NAME = 'tools'
+HASH_LENGTH = 12
+
+
+def canonical_hash(document):
+    data = json.dumps(document, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ToolStore(object):
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+    def name(self, filename, document):
+        """
+        Return the tool id, its canonical hash and the name it is stored under
+        """
+        tool_id = document.get('id') or os.path.splitext(filename)[0]
+        digest = canonical_hash(document)
+        return tool_id, digest, '{0}-{1}.cwl'.format(tool_id, digest[:HASH_LENGTH])
+
+
+class StoreReport(object):
+    """
+    Collects which source files produced which stored tools, to report duplicates and id conflicts of a batch
+    """
+    def __init__(self):
+        self.sources = {}  # {stored name: [source files]}
+        self.versions = {}  # {tool id: {stored name: [source files]}}
+
+    def add(self, source, tools):
+        for tool_id, digest, stored in tools:
+            self.sources.setdefault(stored, []).append(source)
+            self.versions.setdefault(tool_id, {}).setdefault(stored, []).append(source)
+
+    def duplicates(self):
+        return dict((stored, sources) for stored, sources in self.sources.items() if len(sources) > 1)
+
+    def conflicts(self):
+        return dict((tool_id, versions) for tool_id, versions in self.versions.items() if len(versions) > 1)
+
+    def log(self):
+        references = sum(len(sources) for sources in self.sources.values())
+        logger.info('Stored {0} distinct tools for {1} tool definitions'.format(len(self.sources), references))
+        for stored, sources in sorted(self.duplicates().items()):
+            logger.info('Duplicate tool {0} defined in: {1}'.format(
+                stored, ', '.join(sorted(os.path.basename(source) for source in sources))))
+        for tool_id, versions in sorted(self.conflicts().items()):
+            logger.warning('Tool id {0} has {1} different definitions: {2}'.format(
+                tool_id, len(versions), '; '.join('{0} ({1})'.format(
+                    stored, ', '.join(sorted(os.path.basename(source) for source in sources)))
+                    for stored, sources in sorted(versions.items()))))
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'tools': self.sources, 'duplicates': self.duplicates(), 'conflicts': self.conflicts()}, f,
+                      indent=1, sort_keys=True)
@@ -0,0 +1,100 @@
+"""
+CWL versions the converter can target (--cwl-version).
+
+The handlers build every document with the requirements and hints of the newest version. emit() adapts a document
+to the version of the run:
+- requirements and hints the version does not know are dropped and logged, e.g. the ToolTimeLimit of a
+  runtime_minutes attribute in v1.0, and InlineJavascriptRequirement too if only they needed it,
+- from v1.1 on, tools get the requirements WDL semantics allow: LoadListingRequirement no_listing (a WDL File is only
+  ever used as a path, so no directory listing is ever needed) and NetworkAccess (WDL tasks may use the network,
+  which v1.1 runners deny by default), and loadContents moves from inputBinding to the parameter.
+InplaceUpdateRequirement is never emitted, WDL inputs are immutable. The 64 KiB limit of loadContents, which the
+read_X functions rely on, is the same in every version.
+"""
+import logging
+from collections import OrderedDict
+
+from wdl2cwl.requirements import set_requirement, uses_javascript
+
+logger = logging.getLogger('Main')
+
+VERSIONS = ('v1.0', 'v1.1', 'v1.2')
+DEFAULT_VERSION = 'v1.0'
+
+# {class of requirement or hint: first version that has it}
+INTRODUCED = {'LoadListingRequirement': 'v1.1',
+              'NetworkAccess': 'v1.1',
+              'WorkReuse': 'v1.1',
+              'ToolTimeLimit': 'v1.1',
+              'InplaceUpdateRequirement': 'v1.1'}
+
+TOOLS = ('CommandLineTool', 'ExpressionTool')
+
+
+def supports(version, requirement):
+    """
+    Whether a CWL version knows a requirement (or hint) class
+    """
+    return VERSIONS.index(version) >= VERSIONS.index(INTRODUCED.get(requirement, VERSIONS[0]))
+
+
+def _add(requirements, requirement):
+    if all(r.get('class') != requirement['class'] for r in requirements):
+        requirements.append(requirement)
+
+
+def _parameter(param):
+    """
+    Return a parameter with the v1.1 loadContents field instead of the deprecated inputBinding.loadContents
+    """
+    binding = param.get('inputBinding') or {}
+    if not binding.get('loadContents'):
+        return param
+    param = OrderedDict(param)
+    param['loadContents'] = True
+    binding = OrderedDict((key, value) for key, value in binding.items() if key != 'loadContents')
+    if binding:
+        param['inputBinding'] = binding
+    else:
+        del param['inputBinding']
+    return param
+
+
+def emit(document, version=DEFAULT_VERSION):
+    """
+    Return a CWL document for the given version. The document itself is not modified (imported tools are shared)
+    """
+    if version not in VERSIONS:
+        raise ValueError('Unsupported CWL version {0}, expected one of {1}'.format(version, ', '.join(VERSIONS)))
+    document = OrderedDict(document)
+    document['cwlVersion'] = version
+    dropped = False
+    for field in ('requirements', 'hints'):
+        if field in document:
+            kept = []
+            for requirement in document[field]:
+                if supports(version, requirement.get('class')):
+                    kept.append(requirement)
+                else:
+                    dropped = True
+                    logger.info('{0}: {1} is dropped, it requires CWL {2}'.format(
+                        document.get('id', document['class']), requirement['class'], INTRODUCED[requirement['class']]))
+            if kept or field == 'requirements':
+                document[field] = kept
+            else:
+                del document[field]
+    if dropped and 'requirements' in document and not uses_javascript(document):
+        # the JavaScript may have been in what was dropped, e.g. a time limit computed from an input
+        set_requirement(document, 'InlineJavascriptRequirement', False)
+
+    if document['class'] in TOOLS and version != 'v1.0':
+        document['requirements'] = list(document.get('requirements', []))
+        _add(document['requirements'], OrderedDict([('class', 'LoadListingRequirement'),
+                                                    ('loadListing', 'no_listing')]))
+        if document['class'] == 'CommandLineTool':
+            _add(document['requirements'], OrderedDict([('class', 'NetworkAccess'), ('networkAccess', True)]))
+        if isinstance(document['inputs'], dict):
+            document['inputs'] = OrderedDict((key, _parameter(param)) for key, param in document['inputs'].items())
+        else:
+            document['inputs'] = [_parameter(param) for param in document['inputs']]
+    return document